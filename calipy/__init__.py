@@ -1,12 +1,10 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
 
+from calipy.lazy import lazy_exports
+
 SOFTWARE = "calipy"
 VERSION = "1.4.1"
 
-# Always at least provide VERSION
-try:
-    from . import core, ui, metaio, calib, detect
-    from .main import main
-except ImportError:
-    pass
+# Subpackages are imported on first access, so e.g. calipy.metaio does not pull in PyQt5, OpenCV or matplotlib
+lazy_exports(__name__, {'main': 'main'}, submodules=['core', 'ui', 'metaio', 'calib', 'detect', 'report'])
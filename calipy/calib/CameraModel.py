@@ -6,6 +6,38 @@ import cv2
 import numpy as np
 from scipy.spatial.transform import Rotation as R  # noqa
 
+from calipy import detect
+
+
+class Projection:
+    """ Precomputed camera of a calibration, projecting board corners into the sensor """
+
+    def __init__(self, calibration, board_corners):
+        self.rmat_cam = R.from_rotvec(np.asarray(calibration['rvec_cam']).reshape(3)).as_matrix()
+        self.tvec_cam = np.asarray(calibration['tvec_cam']).reshape(3)
+        self.camera = calibcamlib.Camera(calibration['K' if 'K' in calibration else 'A'],
+                                         calibration['D' if 'D' in calibration else 'k'],
+                                         xi=calibration['xi'][0])
+        self.board_corners = board_corners
+
+    def project(self, rvecs, tvecs, square_ids=None, offset=(0, 0)):
+        """ Project board corners (all or square_ids) for n board poses, returns [n, n_corners, 2] """
+        rvecs = np.asarray(rvecs).reshape(-1, 3)
+        tvecs = np.asarray(tvecs).reshape(-1, 3)
+
+        board_corners = self.board_corners
+        if square_ids is not None:
+            board_corners = board_corners[np.asarray(square_ids).reshape(-1)]
+
+        # Board to camera coordinates for all poses at once
+        rmats = self.rmat_cam @ R.from_rotvec(rvecs).as_matrix()
+        tvecs = tvecs @ self.rmat_cam.T + self.tvec_cam
+        coords_cam = np.einsum('nij,cj->nci', rmats, board_corners) + tvecs[:, np.newaxis, :]
+
+        img_points = self.camera.space_to_sensor(coords_cam.reshape(-1, 3), offset=np.asarray(offset))
+
+        return np.asarray(img_points).reshape(len(rvecs), len(board_corners), 2)
+
 
 class CameraModel:
     ID = "calibcam-camera"
@@ -21,22 +53,72 @@ class CameraModel:
         self.marker_size = (1, 0.6)
 
         self.board = cv2.aruco.CharucoBoard(self.board_size, *self.marker_size, self.dictionary)
+        self.board_corners = self.board.getChessboardCorners()
         self.num_feats = (self.board_size[0] - 1) * (self.board_size[1] - 1)
         self.min_det_feats = int(max(self.board_size))
 
+        self.board_key = None
+        self._projections = {}  # id(calibration) > (calibration, Projection)
+
     def configure(self, parameters):
-        self.board_size = (parameters['square_x'][0], parameters['square_y'][0])
-        self.marker_size = (parameters['square_length'][0], parameters['marker_length'][0])
+        # Nothing to do if board is unchanged
+        key = detect.BoardRegistry.get_key(parameters)
+        if key == self.board_key:
+            return
+        self.board_key = key
 
-        self.dictionary_id = {4: cv2.aruco.DICT_4X4_1000,
-                              5: cv2.aruco.DICT_5X5_1000,
-                              6: cv2.aruco.DICT_6X6_1000,
-                              7: cv2.aruco.DICT_7X7_1000}[parameters['dictionary'][0]]
+        board = detect.BoardRegistry.get_board(parameters)
 
-        self.dictionary = cv2.aruco.getPredefinedDictionary(self.dictionary_id)
-        self.board = cv2.aruco.CharucoBoard(self.board_size, *self.marker_size, self.dictionary)
-        self.num_feats = (self.board_size[0] - 1) * (self.board_size[1] - 1)
-        self.min_det_feats = int(max(self.board_size))
+        self.board_size = board.board_size
+        self.marker_size = board.marker_size
+
+        self.dictionary_id = board.dictionary_id
+        self.dictionary = board.dictionary
+        self.board = board.board
+        self.num_feats = board.num_feats
+        self.min_det_feats = board.min_det_feats
+
+        # Projections hold the board corners and have to be recreated if they change
+        self.board_corners = board.chessboard_corners
+        self._projections.clear()
+
+    def get_projection(self, calibration):
+        """ Get cached projection of calibration """
+        # Keep the calibration referenced, so its id stays unique while cached
+        cached = self._projections.get(id(calibration), None)
+        if cached is None or cached[0] is not calibration:
+            cached = (calibration, Projection(calibration, self.board_corners))
+            self._projections[id(calibration)] = cached
+
+        return cached[1]
+
+    def clear_projections(self):
+        self._projections.clear()
+
+    @staticmethod
+    def get_pose(estimation):
+        """ Return board pose of single camera or system estimation """
+        if 'rvec' in estimation:
+            return estimation['rvec'], estimation['tvec']
+
+        return estimation['rvec_board'], estimation['tvec_board']
+
+    def reproject(self, calibration, estimations, offset=(0, 0)):
+        """ Reproject all board corners for a map of frame index to estimation
+
+        Returns sorted frame indices and [n_frames, n_corners, 2] sensor coordinates.
+        """
+        # All items at once, so lazily derived estimations are built in one go
+        items = sorted(estimations.items(), key=lambda item: item[0])
+        frames = np.asarray([frm_idx for frm_idx, _ in items], dtype=np.int64)
+        if not len(frames):
+            return frames, np.zeros((0, len(self.board_corners), 2))
+
+        poses = [self.get_pose(estimation) for _, estimation in items]
+        rvecs = np.asarray([pose[0] for pose in poses])
+        tvecs = np.asarray([pose[1] for pose in poses])
+
+        return frames, self.get_projection(calibration).project(rvecs, tvecs, offset=offset)
 
     def board_params_calibcam(self):
         return {'boardWidth': self.board_size[0],
@@ -47,32 +129,20 @@ class CameraModel:
                 'marker_size': self.marker_size[1] / self.marker_size[0],
                 'dictionary_type': self.dictionary_id}
 
-    def draw(self, frame, detected, calibration, estimation, offset=(0, 0)):
-        # TODO: clean it and switch to calibcamlib functions,
-        if calibration and estimation and ('square_ids' in detected):
-            if 'rvec' in estimation:
-                rmat = (R.from_rotvec(calibration['rvec_cam']) *
-                        R.from_rotvec(estimation['rvec'])).as_matrix()
-                tvec = R.from_rotvec(calibration['rvec_cam']).apply(estimation['tvec']) + calibration['tvec_cam']
-            else:
-                rmat = (R.from_rotvec(calibration['rvec_cam']) *
-                        R.from_rotvec(estimation['rvec_board'])).as_matrix()
-                tvec = R.from_rotvec(calibration['rvec_cam']).apply(estimation['tvec_board']) + calibration['tvec_cam']
-
-            obj_points = self.board.getChessboardCorners()[detected['square_ids']]
-
-            if len(obj_points):
-                obj_points = np.squeeze(obj_points)
-                coords_cam = (rmat @ obj_points.T).T + tvec.reshape(1, 3)
-                cam = calibcamlib.Camera(calibration['K' if 'K' in calibration else 'A'],
-                                         calibration['D' if 'D' in calibration else 'k'],
-                                         xi=calibration['xi'][0])
-                img_points = cam.space_to_sensor(coords_cam, offset=np.asarray(offset))
+    def get_overlay(self, detected, calibration, estimation, offset=(0, 0)):
+        """ Return reprojected corners and their error vectors to the detected corners in image coordinates """
+        if not (calibration and estimation and ('square_ids' in detected) and len(detected['square_ids'])):
+            return {}
+
+        rvec, tvec = self.get_pose(estimation)
+        img_points = self.get_projection(calibration).project(rvec, tvec, detected['square_ids'], offset)[0]
 
-                for point in img_points:
-                    cv2.drawMarker(frame, (int(point[0]), int(point[1])), (0, 0, 255))
+        overlay = {'reprojected_corners': img_points}
+        if 'square_corners' in detected:
+            detected_points = np.asarray(detected['square_corners']).reshape(-1, 2) - np.asarray(offset)
+            overlay['errors'] = np.stack([detected_points, img_points], axis=1)
 
-        return frame
+        return overlay
 
 
 @DeprecationWarning
@@ -1,4 +1,9 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
 
-from .CameraModel import CameraModel
+from calipy.lazy import lazy_exports
+
+# Imported on first access, see calipy.lazy
+lazy_exports(__name__, {
+    'CameraModel': 'CameraModel',
+})
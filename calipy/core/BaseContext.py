@@ -1,9 +1,14 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
 import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict
 
 from calipy import metaio
+from .FrameCache import FrameCache
+from .FramePrefetcher import FramePrefetcher
 
 logger = logging.getLogger(__name__)
 
@@ -12,36 +17,74 @@ class BaseContext:
     """ Controller-style class to handle camera systems management """
     vid_readers: Dict
 
-    def __init__(self):
+    def __init__(self, frame_cache=None, open_readers=True):
         self.system = metaio.CameraSystem()
+        self.system_path = None
         self.session = None
         self.frame_index = 0
 
+        # Without readers, only recordings and their source identifiers are known, e.g. for headless reports
+        self.open_readers = open_readers
         self.vid_readers = {}
+        self._readers = []  # Readers in use, closed once replaced or removed by _readers_changed
+        # Source identifiers of the current session's recordings, maintained by _readers_changed
+        self.source_ids = {}  # cam_id > src_id
+        self.camera_ids = {}  # src_id > cam_id
+        self._all_source_ids = None
+        # Session properties derived from the recordings, maintained by _readers_changed
+        self.sensor_offsets = {}  # cam_id > offset
+        self._length = None
+        # Decoded frames of all cameras share one memory budget
+        self.frame_cache = frame_cache if frame_cache is not None else FrameCache()
+        self.prefetcher = FramePrefetcher(self.frame_cache)
+        # Decoding releases the GIL, so cameras are fetched concurrently
+        self.executor = ThreadPoolExecutor(thread_name_prefix="calipy-frames")
+
+        self._request_lock = threading.Lock()
+        self._request_id = 0
+        self._request_futures = []
 
         self.subset = None
 
     # Camera System
 
-    def load(self, path):
-        """ Load current camera system from file """
+    def load(self, path, progress=None):
+        """ Load current camera system from file, see select_session for progress """
         self.system = metaio.CameraSystem.load(path)
+        self.system_path = path
+        self._all_source_ids = None
 
         if self.system.sessions:
-            self.select_session(0)
+            self.select_session(0, progress=progress)
 
     def save(self, path):
         """ Save current camera system to file """
         self.system.save(path)
+        self.system_path = path
+
+    def get_cache_dir(self):
+        """ Get directory for derived data like seek indices """
+        return metaio.cache_dir(self.system_path)
 
     def clear(self):
         """ Clear current state """
-        self.__init__()
+        self.cancel_frame_requests()
+        self.close()
+        self.frame_cache.clear()
+
+        # Keep request ids unique, so requests still in flight are recognized as stale
+        request_id = self._request_id
+        self.__init__(frame_cache=self.frame_cache, open_readers=self.open_readers)
+        self._request_id = request_id
 
     def close(self):
         """ Close all open files """
-        for reader in self.vid_readers.values():
-            reader.close()
+        # Readers are closed once neither prefetch workers nor frame requests use them
+        self.prefetcher.close()
+        self.executor.shutdown(wait=True)
+
+        self.vid_readers.clear()
+        self._readers_changed()
 
     # Cameras
 
@@ -67,6 +110,7 @@ class BaseContext:
         # Close open files if necessary
         if id in self.vid_readers:
             del self.vid_readers[id]
+        self._readers_changed()
 
         self.system.remove_camera(id)
 
@@ -85,15 +129,34 @@ class BaseContext:
         self.vid_readers.clear()
 
         self.session = self.system.add_session()
+        self._readers_changed()
+
+    def select_session(self, index, progress=None):
+        """ Select session by index
 
-    def select_session(self, index):
-        """ Select session by index """
+        Recordings are opened concurrently, progress(opened, total) is called after each of them.
+        """
         self.vid_readers.clear()
 
         self.session = self.system.sessions[index]
+        self.session.compute_hashes()
 
-        for id, rec in self.session.recordings.items():
-            self.vid_readers[id] = rec.init_reader()
+        if self.open_readers:
+            cache_dir = self.get_cache_dir()
+            futures = {self.executor.submit(rec.init_reader, cache_dir, True): id
+                       for id, rec in self.session.recordings.items()}
+
+            readers = {}
+            for count, future in enumerate(as_completed(futures), 1):
+                readers[futures[future]] = future.result()
+
+                if progress is not None:
+                    progress(count, len(futures))
+
+            # Keep order of recordings
+            for id in self.session.recordings:
+                self.vid_readers[id] = readers[id]
+        self._readers_changed()
 
     def remove_session(self, index):
         """ Remove session by index """
@@ -102,6 +165,7 @@ class BaseContext:
             self.session = None
 
         self.system.remove_session(index)
+        self._readers_changed()
 
     # Recordings
 
@@ -114,32 +178,39 @@ class BaseContext:
             del self.vid_readers[id_str]
 
         rec = self.session.add_recording(id_str, path, None, pipeline=pipeline)
-        self.vid_readers[id_str] = rec.init_reader()
+        if self.open_readers:
+            self.vid_readers[id_str] = rec.init_reader(cache_dir=self.get_cache_dir(), lazy=True)
+        self.session.fps = None
+        self._readers_changed()
+
+    def open_videos(self, videos, pipelines=None):
+        """ Add new session with one camera and recording per video, with optional svidreader pipelines """
+        self.add_session()
+        for i, rec in enumerate(videos):
+            self.add_camera(str(i))
+            pipeline = None
+            if pipelines is not None:
+                pipeline = pipelines[i] if len(pipelines[i]) else None
+            self.add_recording(str(i), rec, pipeline=pipeline)
 
     def get_current_source_ids(self):
         """ Return current camera to source identifier map """
-        sources = {}
-        for cam in self.get_cameras():
-            rec = self.session.recordings.get(cam.id, None)
-
-            if rec:
-                sources[cam.id] = rec.get_source_id()
-
-        return sources
+        return {cam.id: self.source_ids[cam.id] for cam in self.get_cameras() if cam.id in self.source_ids}
 
     def get_all_source_ids(self):
         """" Return a map containing all camera to source maps """
-        result = []
-        for session in self.system.sessions:
-            sources = {}
+        if self._all_source_ids is None:
+            self._all_source_ids = []
+            for session in self.system.sessions:
+                sources = {}
 
-            for cam_id, rec in session.recordings.items():
-                sources[cam_id] = rec.get_source_id()
+                for cam_id, rec in session.recordings.items():
+                    sources[cam_id] = rec.get_source_id()
 
-            if sources:
-                result.append(sources)
+                if sources:
+                    self._all_source_ids.append(sources)
 
-        return result
+        return self._all_source_ids
 
     def remove_recording(self, id):
         """ Remove recording from current session """
@@ -150,6 +221,29 @@ class BaseContext:
             del self.vid_readers[id]
 
         self.session.remove_recording(id)
+        self.session.fps = None
+        self._readers_changed()
+
+    def _readers_changed(self):
+        """ Propagate changes of the recordings and open readers """
+        self.source_ids = {}
+        if self.session is not None:
+            self.source_ids = {id: rec.get_source_id() for id, rec in self.session.recordings.items()}
+        self.camera_ids = {src_id: id for id, src_id in self.source_ids.items()}
+        self._all_source_ids = None
+
+        # Readers were opened, so metadata of their recordings is known
+        self.sensor_offsets = {id: self.session.recordings[id].get_sensor_offset() for id in self.vid_readers}
+        self._length = None
+
+        keys = {id: self.source_ids[id] for id in self.vid_readers}
+        self.prefetcher.set_readers(self.vid_readers, keys)
+
+        # Workers of replaced or removed readers are stopped, so the readers can be closed
+        for reader in self._readers:
+            if not any(reader is r for r in self.vid_readers.values()):
+                reader.close()
+        self._readers = list(self.vid_readers.values())
 
     # Frames
 
@@ -158,8 +252,11 @@ class BaseContext:
         if not self.session or not self.vid_readers:
             return 0
 
-        # Find minimum length
-        return min([reader.n_frames for reader in self.vid_readers.values()])
+        # Find minimum length, from metadata probed when the recordings were opened
+        if self._length is None:
+            self._length = min([self.session.recordings[id].n_frames for id in self.vid_readers])
+
+        return self._length
 
     def get_fps(self):
         """ Get frames per second for the session """
@@ -171,8 +268,8 @@ class BaseContext:
                 return max(set(lst), key=lst.count)
 
             fps_list = []
-            for id, reader in self.vid_readers.items():
-                fps = reader.get_meta_data().get('fps', None)
+            for id in self.vid_readers:
+                fps = self.session.recordings[id].fps
                 if fps is None:
                     logger.log(logging.WARNING, f"Could not find 'fps' for the video: "
                                                 f"{self.session.recordings[id].url}, returning 60")
@@ -193,30 +290,217 @@ class BaseContext:
         """ Get current frame index """
         return self.frame_index
 
-    def get_frame(self, id):
-        """ Get current frame by camera id"""
+    def get_frame(self, id, index=None, scale=1.0):
+        """ Get frame by camera id, at the current frame index by default
+
+        If the frame is displayed with less than one display pixel per frame pixel (scale < 1), a frame
+        downscaled by a power of two is returned, use get_frame_size for the full resolution.
+        """
         # Abort if there is no recording for camera
         if id not in self.vid_readers:
             return None
 
-        # Return frame at current index
-        return self.vid_readers[id].get_data(self.frame_index)
+        if index is None:
+            index = self.frame_index
 
-    def get_source_id(self, id):
-        if id not in self.session.recordings:
+        # Return frame at index, served by the prefetcher if already read ahead
+        frame = self.prefetcher.get_frame(id, index)
+        if frame is None:
+            return None
+
+        rec = self.session.recordings[id]
+        if rec.resolution is None or rec.dtype is None:
+            rec.set_frame_format(frame)
+
+        level = self.get_pyramid_level(scale)
+        if level == 0:
+            return frame
+
+        key = (self.get_source_id(id), index, level)
+        scaled = self.frame_cache.get(key)
+        if scaled is None:
+            import cv2
+            scaled = cv2.resize(frame, (max(frame.shape[1] >> level, 1), max(frame.shape[0] >> level, 1)),
+                                interpolation=cv2.INTER_AREA)
+            self.frame_cache.put(key, scaled)
+
+        return scaled
+
+    def get_frames(self, ids, index=None, scales=None):
+        """ Get frames of several cameras concurrently, returned as camera id to frame map
+
+        Blocks until all frames are read, e.g. for scripts without an event loop, see request_frames otherwise.
+        scales optionally maps camera ids to display scales, see get_frame.
+        """
+        if index is None:
+            index = self.frame_index
+
+        if scales is None:
+            scales = {}
+
+        futures = {id: self.executor.submit(self.get_frame, id, index, scales.get(id, 1.0)) for id in ids}
+
+        return {id: future.result() for id, future in futures.items()}
+
+    def request_frames(self, ids, callback, index=None, scales=None):
+        """ Get frames of several cameras asynchronously and return the request id
+
+        callback(request_id, index, frames) is called from a worker thread once all frames of the request are
+        available. Only the latest request is delivered, frames of older requests are cancelled or dropped.
+        """
+        if index is None:
+            index = self.frame_index
+
+        if scales is None:
+            scales = {}
+
+        with self._request_lock:
+            request_id = self._cancel_requests()
+            futures = {id: self.executor.submit(self.get_frame, id, index, scales.get(id, 1.0)) for id in ids}
+            self._request_futures = list(futures.values())
+
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def deliver():
+            if not self.is_current_request(request_id):
+                return
+
+            frames = {}
+            for id, future in futures.items():
+                if future.cancelled():
+                    return
+
+                try:
+                    frames[id] = future.result()
+                except Exception as e:
+                    logger.log(logging.WARNING, f"Could not read frame {index} of camera {id}: {e}")
+                    frames[id] = None
+
+            callback(request_id, index, frames)
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            deliver()
+
+        if futures:
+            for future in futures.values():
+                future.add_done_callback(on_done)
+        else:
+            deliver()
+
+        return request_id
+
+    def cancel_frame_requests(self):
+        """ Cancel pending frame requests, their callbacks are never called """
+        with self._request_lock:
+            self._cancel_requests()
+
+    def _cancel_requests(self):
+        self._request_id += 1
+
+        # Frames of superseded requests that are not being read yet are never read
+        for future in self._request_futures:
+            future.cancel()
+        self._request_futures = []
+
+        return self._request_id
+
+    def is_request_pending(self):
+        """ Check if frames of the latest request are still being read """
+        with self._request_lock:
+            return any(not future.done() for future in self._request_futures)
+
+    def is_current_request(self, request_id):
+        """ Check if request is the latest frame request """
+        return request_id == self._request_id
+
+    def has_reader(self, id):
+        """ Check if camera has an open recording in the current session """
+        return id in self.vid_readers
+
+    def get_preview_frame(self, id, index=None):
+        """ Get already decoded frame closest to index without blocking, and have the exact frame read in the background
+
+        The frame may be downscaled, see get_frame. None if no frame of the camera is cached yet.
+        """
+        if id not in self.vid_readers:
             return None
 
-        return self.session.recordings[id].get_source_id()
+        if index is None:
+            index = self.frame_index
+
+        self.prefetcher.request_frame(id, index)
+
+        return self.frame_cache.get_nearest(self.get_source_id(id), index)
+
+    def get_frame_size(self, id):
+        """ Get full resolution (width, height) of camera's frames, None if unknown """
+        if self.session is None or id not in self.session.recordings:
+            return None
+
+        return self.session.recordings[id].resolution
+
+    @staticmethod
+    def get_pyramid_level(scale):
+        """ Return how often a frame can be halved to still have at least scale display pixels per frame pixel """
+        if scale >= 1:
+            return 0
+
+        return min(int(math.floor(math.log2(1 / scale))), 4)
+
+    def get_overlay(self, id, index=None):
+        """ Get vector data to display on top of frame, none without results """
+        return {}
+
+    def get_read_ahead(self):
+        """ Get requested number of frames read ahead in the background """
+        return self.prefetcher.ahead
+
+    def set_read_ahead(self, frames):
+        """ Set number of frames read ahead in the background, e.g. more during playback
+
+        Read-ahead is limited by the frame cache budget, see FramePrefetcher.get_read_ahead.
+        """
+        self.prefetcher.set_read_ahead(frames)
+
+    def get_prefetch_stats(self):
+        """ Get hit and miss counters of the frame prefetcher """
+        return self.prefetcher.get_stats()
+
+    def get_frame_cache_stats(self):
+        """ Get usage and hit statistics of the shared frame cache """
+        return self.frame_cache.get_stats()
+
+    def get_source_id(self, id):
+        """ Get source identifier of camera's recording in the current session, or None """
+        return self.source_ids.get(id, None)
+
+    def get_camera_id(self, src_id):
+        """ Get camera of source identifier in the current session, or None """
+        return self.camera_ids.get(src_id, None)
 
     def get_sensor_offset(self, id):
         """ Get current offset """
-        if id not in self.session.recordings:
-            return None
+        if id not in self.sensor_offsets:
+            if self.session is None or id not in self.session.recordings:
+                return None
 
-        return self.session.recordings[id].get_sensor_offset()
+            # Recordings without reader, e.g. without open_readers, are probed if their metadata is unknown
+            self.sensor_offsets[id] = self.session.recordings[id].get_sensor_offset()
+
+        return self.sensor_offsets[id]
 
     # Index subsets
 
     def get_available_subsets(self):
         """ Return available subsets of frames """
         return {"All": None}
+
+    def set_subset(self, subset):
+        """ Set sorted frame indices the user steps through, or None for all frames """
+        self.subset = subset
+        self.prefetcher.set_subset(subset)
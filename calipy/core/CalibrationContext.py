@@ -1,17 +1,17 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
-import copy
 import logging
+import warnings
+from functools import partial
 from pathlib import Path, PureWindowsPath
 
-import cv2
 import numpy as np
-from matplotlib import pyplot as plt
 
 from calibcamlib.yaml_helper import collection_to_array
 
 from calipy import detect, calib, VERSION
 from .BaseContext import BaseContext
+from .LazyMap import LazyMap
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +23,8 @@ class CalibrationContext(BaseContext):
 
     MODELS = [calib.CameraModel]
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, frame_cache=None, open_readers=True):
+        super().__init__(frame_cache=frame_cache, open_readers=open_readers)
 
         # Initialize detectors and models with context
         self.detectors = [D(self) for D in self.DETECTORS]
@@ -36,13 +36,14 @@ class CalibrationContext(BaseContext):
         self.display_calib_index = 0
 
         # Initialize results
-        self.detections = {}  # det_id > src_id > frm_idx > { <detector specific> }
+        self.detections = {}  # det_id > src_id > DetectionTable (frm_idx > { <detector specific> })
         self.board_params = {}  # det_id > { <detector specific> }
 
         self.calibrations = {}  # mod_id > cam_id > { rvec: vec3, tvec: vec3, <calibration specific> }
         self.estimations = {}  # mod_id > src_id > frm_idx > { rvec: vec3, tvec: vec3 }
 
         self.calibrations_multi = {}  # mod_id > cam_id > { rX1: vec3, tX1: vec3, <calibration specific> }
+        self.system_errors = {}  # mod_id > cam_id > { mean_err, med_err, max_err }
         # mod_id > { refcam_id, opt_result, intrinsic_flags }
 
         # Assumed single source for each camera
@@ -50,6 +51,16 @@ class CalibrationContext(BaseContext):
 
         self.other = {}
 
+    def select_session(self, index, progress=None):
+        """ Override session selection to attach stored detections """
+        super().select_session(index, progress=progress)
+        self.load_stored_detections()
+
+    def add_recording(self, id_str, path, pipeline=None):
+        """ Override recording addition to attach stored detections """
+        super().add_recording(id_str, path, pipeline=pipeline)
+        self.load_stored_detections()
+
     def get_available_subsets(self):
         """ Override available subsets to add calibration based subsets"""
         subsets = super().get_available_subsets()
@@ -62,8 +73,7 @@ class CalibrationContext(BaseContext):
             estimations = self.get_current_estimations()
             est_idx = set()
 
-            for rec in self.session.recordings.values():
-                src_id = rec.get_source_id()
+            for src_id in self.source_ids.values():
                 det_idx.update(detections.get(src_id, []))
                 est_idx.update(estimations.get(src_id, []))
 
@@ -75,42 +85,39 @@ class CalibrationContext(BaseContext):
 
         return subsets
 
-    def get_frame(self, idx):
-        """ Override frame retrieval to draw calibration result """
-        frame = copy.copy(super().get_frame(idx))
+    def get_overlay(self, idx, index=None):
+        """ Get detection and calibration result of camera as vector data to display on top of the frame """
+        if index is None:
+            index = self.frame_index
+
         src_id = self.get_source_id(idx)
         sensor_offset = self.get_sensor_offset(idx)
 
-        detection = self.get_current_detections().get(src_id, {}).get(self.frame_index, None)
+        detection = self.get_current_detections().get(src_id, {}).get(index, None)
         # Board parameters
         board_params = self.get_current_board_params()
 
         if detection is None:
-            return frame
+            return {}
 
-        # Make sure we draw in color by converting the frame to color first if necessary
-        if frame.ndim < 3 or frame.shape[2] == 1:
-            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
-
-        # Draw detection result
+        # Detection result
         detector = self.get_current_detector()
         detector.configure(board_params)
-        frame = detector.draw(frame, detection, offset=sensor_offset)
+        overlay = detector.get_overlay(detection, offset=sensor_offset)
 
         if self.display_calib_index == 0:
             calibration = self.get_current_calibrations().get(idx, None)
-            estimation = self.get_current_estimations().get(src_id, {}).get(self.frame_index, None)
+            estimation = self.get_current_estimations().get(src_id, {}).get(index, None)
         else:
             calibration = self.get_current_calibrations_multi().get(idx, None)
-            estimation = self.get_current_estimations_boards().get(src_id, {}).get(self.frame_index, None)
-
-        # Draw calibration result
+            estimation = self.get_current_estimations_boards().get(src_id, {}).get(index, None)
 
+        # Calibration result
         model = self.get_current_model()
         model.configure(board_params)
-        frame = model.draw(frame, detection, calibration, estimation, offset=sensor_offset)
+        overlay.update(model.get_overlay(detection, calibration, estimation, offset=sensor_offset))
 
-        return frame
+        return overlay
 
     # Detector and detection management
 
@@ -129,6 +136,97 @@ class CalibrationContext(BaseContext):
     def get_current_detections(self):
         return self.detections.get(self.get_current_detector().ID, {})
 
+    def detect(self, ids=None, start=0, stop=None, step=1, processes=None, progress=None, resume=True):
+        """ Run current detector on recordings of current session, by default on all cameras
+
+        Frames in [start, stop) with stride step are detected using a pool of processes. Results are appended
+        to the detection store of each source in the cache directory, so an interrupted run continues with the
+        frames not processed yet if resume is set. progress is called with (cam_id, done, total).
+        """
+        if not self.session:
+            return
+
+        cache_dir = self.get_cache_dir()
+
+        detector = self.get_current_detector()
+        board_params = self.board_params.setdefault(detector.ID, detector.get_board_params())
+        detector.configure(board_params)
+        detect.DetectionStore.save_board_params(cache_dir, detector.ID, board_params)
+
+        detections = self.detections.setdefault(detector.ID, {})
+
+        if ids is None:
+            ids = list(self.session.recordings.keys())
+
+        for cam_id in ids:
+            rec = self.session.recordings[cam_id]
+            src_id = self.get_source_id(cam_id)
+
+            store = detect.DetectionStore.for_source(cache_dir, detector.ID, src_id)
+            if not resume:
+                store.clear()
+
+            # Separate reader, so the sequential pass does not disturb the displayed frames
+            reader = rec.init_reader(cache_dir=cache_dir)
+            try:
+                cam_progress = None if progress is None else lambda d, t, c=cam_id: progress(c, d, t)
+                detector.detect_recording(reader, start, stop, step,
+                                          offset=rec.get_sensor_offset(),
+                                          processes=processes,
+                                          progress=cam_progress,
+                                          skip=store.get_processed_frames(),
+                                          on_chunk=store.append)
+            finally:
+                reader.close()
+
+            detections[src_id] = detect.LazyDetections(store)
+
+    def save(self, path):
+        """ Save current camera system to file, and take stored detections along to its cache directory """
+        old_cache_dir = self.get_cache_dir()
+        # Detections computed before the first save are only kept in the user cache until then
+        copy = self.system_path is not None
+
+        super().save(path)
+
+        cache_dir = self.get_cache_dir()
+        if cache_dir != old_cache_dir:
+            self._move_detections(cache_dir, copy=copy)
+
+    def _move_detections(self, cache_dir, copy=False):
+        for det_id, detections in self.detections.items():
+            stored = {src_id: d for src_id, d in detections.items() if isinstance(d, detect.LazyDetections)}
+            for src_id, lazy_detections in stored.items():
+                lazy_detections.store.move_to(detect.DetectionStore.for_source(cache_dir, det_id, src_id).path,
+                                              copy=copy)
+
+            if stored and det_id in self.board_params:
+                detect.DetectionStore.save_board_params(cache_dir, det_id, self.board_params[det_id])
+
+    def load_stored_detections(self):
+        """ Attach stored detections of the current session's sources, loaded on first access """
+        if not self.session:
+            return
+
+        cache_dir = self.get_cache_dir()
+
+        for detector in self.detectors:
+            detections = self.detections.get(detector.ID, {})
+
+            for src_id in self.source_ids.values():
+                store = detect.DetectionStore.for_source(cache_dir, detector.ID, src_id)
+
+                if src_id not in detections and store.exists():
+                    detections[src_id] = detect.LazyDetections(store)
+
+            if detections:
+                self.detections[detector.ID] = detections
+
+                if detector.ID not in self.board_params:
+                    board_params = detect.DetectionStore.load_board_params(cache_dir, detector.ID)
+                    if board_params is not None:
+                        self.board_params[detector.ID] = board_params
+
     # Model and calibration management
 
     def get_model_names(self):
@@ -152,6 +250,9 @@ class CalibrationContext(BaseContext):
     def get_current_calibrations_multi(self):
         return self.calibrations_multi.get(self.get_current_model().ID, {})
 
+    def get_current_system_errors(self):
+        return self.system_errors.get(self.get_current_model().ID, {})
+
     def get_current_estimations_boards(self):
         return self.estimations_boards.get(self.get_current_model().ID, {})
 
@@ -192,6 +293,7 @@ class CalibrationContext(BaseContext):
         # Detection specific
         start_frame_indexes = calib_dict['info']['opts'].get('start_frame_indexes', [0] * len(rec_file_names))
         used_frame_indices = calib_dict['info']['used_frames_ids']
+        # Large arrays are only sliced, so memory-mapped results are read for the frames actually used
         corners = np.asarray(calib_dict['info']['corners'])
 
         # Single camera calibraion
@@ -202,10 +304,8 @@ class CalibrationContext(BaseContext):
         tvecs_boards = calib_dict['info']['tvecs_boards']
         if 'fun_final' in calib_dict['info']:
             final_err = np.asarray(calib_dict['info']['fun_final']).reshape(corners.shape)
-            final_err = np.abs(final_err)
         else:
-            final_err = np.empty(corners.shape)
-            final_err[:] = np.nan
+            final_err = None
 
         # Set detector
         for index, detor in enumerate(self.detectors):
@@ -226,44 +326,137 @@ class CalibrationContext(BaseContext):
         self.estimations[model.ID] = {}
         self.calibrations_multi[model.ID] = {}
         self.estimations_boards[model.ID] = {}
+        multi_cam_indices = {}  # cam_id > calibcam camera index
 
-        # Set data
+        # Set data, per-frame estimations and errors are derived on first access
         for cam_id, rec in self.session.recordings.items():
             rec_unique_name = get_path(rec.url).parts[unique_idx]
             if rec_unique_name in rec_file_unique_names:
                 calibcam_cam_idx = rec_file_unique_names.index(rec_unique_name)
-                src_id = rec.get_source_id()
+                src_id = self.get_source_id(cam_id)
 
-                frames_mask_cam = calibs_single[calibcam_cam_idx]['frames_mask']
+                frames_mask_cam = np.asarray(calibs_single[calibcam_cam_idx]['frames_mask'], dtype=bool)
                 self.calibrations[model.ID][cam_id] = calibs_single[calibcam_cam_idx]
                 if len(calib_dict['calibs']):
                     self.calibrations_multi[model.ID][cam_id] = calib_dict['calibs'][calibcam_cam_idx]
-                    self.calibrations_multi[model.ID][cam_id]['max_err'] = np.nanmax(final_err[calibcam_cam_idx])
-                    self.calibrations_multi[model.ID][cam_id]['med_err'] = np.nanmedian(final_err[calibcam_cam_idx])
-                    self.calibrations_multi[model.ID][cam_id]['mean_err'] = np.nanmean(final_err[calibcam_cam_idx])
-
-                self.detections[detector.ID][src_id] = {}
-                self.estimations[model.ID][src_id] = {}
-                self.estimations_boards[model.ID][src_id] = {}
-                for index, frm_idx in enumerate(used_frame_indices):
-                    frm_idx += start_frame_indexes[calibcam_cam_idx]
-                    self.detections[detector.ID][src_id][frm_idx] = detector.extract_calibcam(
-                        corners[calibcam_cam_idx, index])
-
-                    if frames_mask_cam[index]:
-                        self.estimations[model.ID][src_id][frm_idx] = {
-                            'rvec': calibs_single[calibcam_cam_idx]['rvecs'][index],
-                            'tvec': calibs_single[calibcam_cam_idx]['tvecs'][index]}
-
-                    if len(rvecs_boards):
-                        self.estimations_boards[model.ID][src_id][frm_idx] = {'rvec_board': rvecs_boards[index],
-                                                                              'tvec_board': tvecs_boards[index],
-                                                                              'max_err': np.nanmax(
-                                                                                  final_err[calibcam_cam_idx, index]),
-                                                                              'med_err': np.nanmedian(
-                                                                                  final_err[calibcam_cam_idx, index]),
-                                                                              'mean_err': np.nanmean(
-                                                                                  final_err[calibcam_cam_idx, index])}
+                    multi_cam_indices[cam_id] = calibcam_cam_idx
+
+                frames = np.asarray(used_frame_indices) + start_frame_indexes[calibcam_cam_idx]
+
+                self.detections[detector.ID][src_id] = detect.DetectionTable(frames, corners[calibcam_cam_idx])
+
+                # Frame indices are known upfront, so subsets and single frames never build the whole map
+                rvecs = calibs_single[calibcam_cam_idx]['rvecs']
+                tvecs = calibs_single[calibcam_cam_idx]['tvecs']
+                est_indices = np.flatnonzero(frames_mask_cam)
+                self.estimations[model.ID][src_id] = LazyMap(
+                    partial(self._build_estimations, frames, frames_mask_cam, rvecs, tvecs),
+                    keys=frames[est_indices].tolist(),
+                    get_item=partial(self._get_estimation, est_indices, rvecs, tvecs))
+
+                if len(rvecs_boards):
+                    self.estimations_boards[model.ID][src_id] = LazyMap(
+                        partial(self._build_estimations_boards, frames, rvecs_boards, tvecs_boards,
+                                partial(self._get_abs_errors, final_err, corners, calibcam_cam_idx)),
+                        keys=frames.tolist(),
+                        get_item=partial(self._get_estimation_board, rvecs_boards, tvecs_boards, final_err,
+                                         corners, calibcam_cam_idx))
+                else:
+                    self.estimations_boards[model.ID][src_id] = {}
+
+        # Residuals of a camera are only read once its system errors are requested
+        self.system_errors[model.ID] = LazyMap(
+            keys=list(multi_cam_indices.keys()),
+            get_item=partial(self._get_system_errors, final_err, corners, list(multi_cam_indices.values())))
+
+        # Precompute projections of all loaded calibrations
+        model.configure(self.board_params[detector.ID])
+        model.clear_projections()
+        for calibration in list(self.calibrations[model.ID].values()) + \
+                list(self.calibrations_multi[model.ID].values()):
+            model.get_projection(calibration)
+
+    @staticmethod
+    def _get_abs_errors(final_err, corners, cam_idx):
+        """ Return absolute residuals of camera, NaN if the result has none """
+        if final_err is None:
+            return np.full(corners.shape[1:], np.nan)
+
+        return np.abs(final_err[cam_idx])
+
+    @staticmethod
+    def _get_error_stats(errors, axis=None):
+        """ Return mean, median and max of absolute errors, NaN without any error """
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            return np.nanmean(errors, axis=axis), np.nanmedian(errors, axis=axis), np.nanmax(errors, axis=axis)
+
+    @staticmethod
+    def _get_system_errors(final_err, corners, cam_indices, position):
+        mean_err, med_err, max_err = CalibrationContext._get_error_stats(
+            CalibrationContext._get_abs_errors(final_err, corners, cam_indices[position]))
+
+        return {'mean_err': float(mean_err), 'med_err': float(med_err), 'max_err': float(max_err)}
+
+    @staticmethod
+    def _get_estimation(indices, rvecs, tvecs, position):
+        return {'rvec': rvecs[indices[position]], 'tvec': tvecs[indices[position]]}
+
+    @staticmethod
+    def _get_estimation_board(rvecs_boards, tvecs_boards, final_err, corners, cam_idx, position):
+        if final_err is None:
+            errors = np.nan
+        else:
+            errors = np.abs(final_err[cam_idx, position])
+        mean_err, med_err, max_err = CalibrationContext._get_error_stats(errors)
+
+        return {'rvec_board': rvecs_boards[position],
+                'tvec_board': tvecs_boards[position],
+                'max_err': float(max_err),
+                'med_err': float(med_err),
+                'mean_err': float(mean_err)}
+
+    @staticmethod
+    def _build_estimations(frames, frames_mask, rvecs, tvecs):
+        return {frm_idx: {'rvec': rvecs[index], 'tvec': tvecs[index]}
+                for index, frm_idx in zip(np.flatnonzero(frames_mask), frames[frames_mask].tolist())}
+
+    @staticmethod
+    def _build_estimations_boards(frames, rvecs_boards, tvecs_boards, get_errors):
+        # Error statistics of all frames at once, all-NaN frames (no detection) result in NaN
+        frame_err = get_errors().reshape(len(frames), -1)
+        frame_mean_err, frame_med_err, frame_max_err = CalibrationContext._get_error_stats(frame_err, axis=1)
+
+        return {frm_idx: {'rvec_board': rvecs_boards[index],
+                          'tvec_board': tvecs_boards[index],
+                          'max_err': max_err,
+                          'med_err': med_err,
+                          'mean_err': mean_err}
+                for index, (frm_idx, max_err, med_err, mean_err) in enumerate(zip(frames.tolist(),
+                                                                                  frame_max_err.tolist(),
+                                                                                  frame_med_err.tolist(),
+                                                                                  frame_mean_err.tolist()))}
+
+    def get_reprojections(self, cam_id):
+        """ Reproject board corners of all estimated frames of camera with current model and display setting
+
+        Returns sorted frame indices and [n_frames, n_corners, 2] sensor coordinates.
+        """
+        model = self.get_current_model()
+        model.configure(self.get_current_board_params())
+
+        src_id = self.get_source_id(cam_id)
+        if self.display_calib_index == 0:
+            calibration = self.get_current_calibrations().get(cam_id, None)
+            estimations = self.get_current_estimations().get(src_id, {})
+        else:
+            calibration = self.get_current_calibrations_multi().get(cam_id, None)
+            estimations = self.get_current_estimations_boards().get(src_id, {})
+
+        if not calibration:
+            estimations = {}
+
+        return model.reproject(calibration, estimations, offset=self.get_sensor_offset(cam_id))
 
     def clear_result(self):
         self.detections.clear()
@@ -272,6 +465,7 @@ class CalibrationContext(BaseContext):
         self.estimations.clear()
 
         self.calibrations_multi.clear()
+        self.system_errors.clear()
         self.estimations_boards.clear()
 
     # Results statistics
@@ -281,23 +475,15 @@ class CalibrationContext(BaseContext):
 
         detections = self.get_current_detections()
 
-        for cam_id, rec in self.session.recordings.items():
-            src_id = rec.get_source_id()
-
+        for cam_id, src_id in self.source_ids.items():
             # Skip detection that were never run
             if src_id not in detections:
                 continue
 
             # Count detections and markers
-            patterns = 0
-            markers = 0
-
-            for detected in detections[src_id].values():
-                if len(detected.get('square_corners', [])):
-                    patterns += 1
-                    markers += len(detected.get('square_corners', []))
+            counts = detections[src_id].counts()
 
-            stats[cam_id] = (patterns, markers)
+            stats[cam_id] = (int(np.count_nonzero(counts)), int(counts.sum()))
 
         return stats
 
@@ -311,7 +497,7 @@ class CalibrationContext(BaseContext):
         calibrations = self.get_current_calibrations()
         estimations = self.get_current_estimations()
 
-        calibrations_multi = self.get_current_calibrations_multi()
+        system_errors = self.get_current_system_errors()
         estimations_board = self.get_current_estimations_boards()
 
         for cam_id, calibration in calibrations.items():
@@ -325,10 +511,10 @@ class CalibrationContext(BaseContext):
                 'detections': count_det,
                 'single_estimations': count_est,
             }
-            if 'med_err' in calibrations_multi.get(cam_id, {}):
-                stats[cam_id].update({'system_errors': (calibrations_multi[cam_id]['mean_err'],
-                                                        calibrations_multi[cam_id]['med_err'],
-                                                        calibrations_multi[cam_id]['max_err'])
+            if cam_id in system_errors:
+                stats[cam_id].update({'system_errors': (system_errors[cam_id]['mean_err'],
+                                                        system_errors[cam_id]['med_err'],
+                                                        system_errors[cam_id]['max_err'])
                                       })
 
             estimations_cam = estimations_board.get(source_id, {})
@@ -339,7 +525,10 @@ class CalibrationContext(BaseContext):
                                       })
         return stats
 
-    def plot_system_calibration_errors(self):
+    def plot_system_calibration_errors(self, file=None):
+        """ Plot per frame errors of system calibration, saved to file if supplied and shown otherwise """
+        from matplotlib import pyplot as plt
+
         source_maps = self.get_current_source_ids()
 
         calibrations = self.get_current_calibrations()
@@ -366,4 +555,8 @@ class CalibrationContext(BaseContext):
             axs[i].set_title(cam_id)
             axs[i].legend()
 
-        plt.show()
+        if file is None:
+            plt.show()
+        else:
+            fig.savefig(file)
+            plt.close(fig)
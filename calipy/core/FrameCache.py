@@ -0,0 +1,98 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCache:
+    """ Thread safe LRU cache of decoded frames shared by all cameras with a global memory budget """
+
+    def __init__(self, max_bytes=4096 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()  # (src_id, frm_idx) > frame
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, key):
+        """ Get frame by (source id, frame index) key or None if not cached """
+        with self._lock:
+            frame = self._frames.get(key, None)
+
+            if frame is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._frames.move_to_end(key)
+
+            return frame
+
+    def put(self, key, frame):
+        """ Add frame, evicting least recently used frames if over budget """
+        # Frames larger than the whole budget are never cached
+        if frame.nbytes > self.max_bytes:
+            logger.log(logging.DEBUG, f"Frame of {frame.nbytes} bytes exceeds cache budget")
+            return
+
+        with self._lock:
+            if key in self._frames:
+                self.nbytes -= self._frames.pop(key).nbytes
+
+            self._frames[key] = frame
+            self.nbytes += frame.nbytes
+
+            self._evict()
+
+    def get_nearest(self, src_id, index):
+        """ Get cached frame of source with the frame index closest to index, at any resolution, or None """
+        with self._lock:
+            keys = [key for key in self._frames if key[0] == src_id]
+            if not keys:
+                return None
+
+            # Prefer closer frames, then higher resolutions
+            key = min(keys, key=lambda k: (abs(k[1] - index), k[2] if len(k) > 2 else 0))
+            return self._frames[key]
+
+    def set_max_bytes(self, max_bytes):
+        """ Change memory budget, evicting frames if necessary """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._frames:
+            _, frame = self._frames.popitem(last=False)
+            self.nbytes -= frame.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """ Remove all frames """
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    def get_stats(self):
+        """ Return usage and hit statistics """
+        total = self.hits + self.misses
+        return {'frames': len(self._frames),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0}
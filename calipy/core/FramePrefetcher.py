@@ -0,0 +1,230 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ReaderWorker(threading.Thread):
+    """ Background thread reading frames of a single reader into the shared frame cache """
+
+    def __init__(self, reader, key, cache):
+        super().__init__(daemon=True)
+        self.reader = reader
+        self.key = key
+        self.cache = cache
+
+        # Serializes access to the reader, which is not thread safe
+        self.reader_lock = threading.Lock()
+
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._loading = None
+        self._stopped = False
+
+        self.last_index = None
+        self.direction = 1
+        self.frame_bytes = 0  # Size of frames read last
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+
+                if self._stopped:
+                    return
+
+                index = self._pending.popleft()
+                if (self.key, index) in self.cache:
+                    continue
+                self._loading = index
+
+            frame = self._read(index)
+
+            with self._cond:
+                self._loading = None
+                if frame is not None:
+                    self.cache.put((self.key, index), frame)
+                self._cond.notify_all()
+
+    def _read(self, index):
+        with self.reader_lock:
+            # The reader may be closed once the worker is stopped
+            if self._stopped:
+                return None
+
+            try:
+                frame = self.reader.get_data(index)
+                self.frame_bytes = frame.nbytes
+                return frame
+            except Exception as e:  # Readers raise various errors past the end of a file
+                logger.log(logging.DEBUG, f"Prefetch of frame {index} failed: {e}")
+                return None
+
+    def lookup(self, index):
+        """ Return cached frame, waiting if it is currently being read, or None """
+        with self._cond:
+            while self._loading == index:
+                self._cond.wait()
+
+        return self.cache.get((self.key, index))
+
+    def read(self, index):
+        """ Read frame synchronously and keep it in the cache """
+        frame = self._read(index)
+
+        if frame is not None:
+            self.cache.put((self.key, index), frame)
+
+        return frame
+
+    def request(self, indices):
+        """ Replace pending read-ahead with the supplied frame indices """
+        with self._cond:
+            self._pending.clear()
+            self._pending.extend(i for i in indices if (self.key, i) not in self.cache)
+            self._cond.notify_all()
+
+    def stop(self, wait=False):
+        """ Stop reading, if wait until the reader is no longer in use, so it can be closed """
+        with self._cond:
+            self._stopped = True
+            self._pending.clear()
+            self._cond.notify_all()
+
+        if wait:
+            self.join()
+            # Synchronous reads in progress hold the lock, later ones return without reading
+            with self.reader_lock:
+                pass
+
+
+class FramePrefetcher:
+    """ Read frames around the current index in the background, one worker thread per reader """
+    # Share of the frame cache read-ahead of all cameras may fill, the rest keeps recently shown frames
+    CACHE_SHARE = 0.5
+
+    def __init__(self, cache, ahead=8, behind=2):
+        self.cache = cache
+        self.ahead = ahead
+        self.behind = behind
+
+        self.hits = 0
+        self.misses = 0
+
+        # Sorted frame indices the user is stepping through, None for all frames
+        self.subset = None
+
+        self._workers = {}  # cam_id > ReaderWorker
+
+    def set_readers(self, readers, keys):
+        """ Synchronize workers with the supplied camera to reader map, caching frames under the keys
+
+        Returns once replaced workers stopped using their readers.
+        """
+        stopped = []
+        for id in list(self._workers.keys()):
+            worker = self._workers[id]
+            if readers.get(id, None) is not worker.reader or keys.get(id, None) != worker.key:
+                self._workers.pop(id).stop()
+                stopped.append(worker)
+
+        # Stop all first, so their current reads finish in parallel
+        for worker in stopped:
+            worker.stop(wait=True)
+
+        for id, reader in readers.items():
+            if id not in self._workers:
+                worker = ReaderWorker(reader, keys[id], self.cache)
+                worker.start()
+                self._workers[id] = worker
+
+    def get_frame(self, id, index):
+        """ Get frame from cache or reader and schedule read-ahead in the scrubbing direction """
+        worker = self._workers[id]
+
+        frame = worker.lookup(index)
+        if frame is None:
+            self.misses += 1
+            frame = worker.read(index)
+        else:
+            self.hits += 1
+
+        self._schedule(worker, index)
+
+        return frame
+
+    def request_frame(self, id, index):
+        """ Have frame read in the background, replacing read-ahead so only the latest request is pending """
+        worker = self._workers[id]
+        if (worker.key, index) not in self.cache:
+            worker.request([index])
+
+    def _schedule(self, worker, index):
+        if worker.last_index is not None and index != worker.last_index:
+            worker.direction = 1 if index > worker.last_index else -1
+        worker.last_index = index
+
+        # Read ahead in the current direction first, then fill in behind
+        d = worker.direction
+        ahead = self.get_read_ahead()
+        if self.subset is None:
+            indices = [index + d * i for i in range(1, ahead + 1)]
+            indices += [index - d * i for i in range(1, self.behind + 1)]
+        else:
+            indices = self._subset_neighbours(index, d, ahead)
+
+        worker.request([i for i in indices if i >= 0])
+
+    def _subset_neighbours(self, index, direction, n_ahead):
+        """ Return the subset entries around index, in direction first """
+        left = bisect_left(self.subset, index)
+        right = bisect_right(self.subset, index)
+
+        if direction > 0:
+            ahead = self.subset[right:right + n_ahead]
+            behind = self.subset[max(left - self.behind, 0):left][::-1]
+        else:
+            ahead = self.subset[max(left - n_ahead, 0):left][::-1]
+            behind = self.subset[right:right + self.behind]
+
+        return list(ahead) + list(behind)
+
+    def set_read_ahead(self, ahead):
+        """ Set number of frames read ahead in the current direction, see get_read_ahead """
+        self.ahead = ahead
+
+    def get_read_ahead(self):
+        """ Get number of frames read ahead, limited so the frames of all cameras fit the cache budget
+
+        Otherwise the least recently used, i.e. the next frames to be shown, would be evicted first.
+        """
+        step_bytes = sum(worker.frame_bytes for worker in list(self._workers.values()))
+        if not step_bytes:
+            return self.ahead
+
+        max_ahead = int(self.cache.max_bytes * self.CACHE_SHARE / step_bytes) - self.behind
+        return max(min(self.ahead, max_ahead), 1)
+
+    def set_subset(self, subset):
+        """ Restrict read-ahead to sorted frame indices, e.g. frames with detections, or None for all frames """
+        self.subset = subset
+
+    def get_stats(self):
+        """ Return hit and miss counters """
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """ Stop all workers, and wait until they no longer use their readers """
+        self.set_readers({}, {})
@@ -0,0 +1,71 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+from collections.abc import Mapping
+
+
+class LazyMap(Mapping):
+    """ Read-only map that is derived on first access
+
+    Either factory builds the whole map at once, or the keys are known upfront and get_item(position) derives the
+    item of keys[position]. If keys are supplied, iteration, membership and len() never build the map. If get_item
+    is supplied, single items are derived (and kept) without building the whole map.
+    """
+
+    def __init__(self, factory=None, keys=None, get_item=None):
+        self.factory = factory
+        self.get_item = get_item
+
+        self._keys = keys
+        self._positions = None  # key > position in keys
+        self._items = {}  # Items derived so far
+        self._map = None
+
+    def _get_map(self):
+        if self._map is None:
+            if self.factory is not None:
+                self._map = self.factory()
+            else:
+                self._map = {key: self[key] for key in self._keys}
+
+        return self._map
+
+    def _get_positions(self):
+        if self._positions is None:
+            self._positions = {key: position for position, key in enumerate(self._keys)}
+
+        return self._positions
+
+    def __contains__(self, key):
+        if self._map is None and self._keys is not None:
+            return key in self._get_positions()
+
+        return key in self._get_map()
+
+    def __getitem__(self, key):
+        if self._map is None and self.get_item is not None:
+            if key not in self._items:
+                self._items[key] = self.get_item(self._get_positions()[key])
+
+            return self._items[key]
+
+        return self._get_map()[key]
+
+    def __iter__(self):
+        if self._map is None and self._keys is not None:
+            return iter(self._keys)
+
+        return iter(self._get_map())
+
+    def __len__(self):
+        if self._map is None and self._keys is not None:
+            return len(self._keys)
+
+        return len(self._get_map())
+
+    # Accessing all items builds the whole map, which the factory may do faster than item by item
+
+    def items(self):
+        return self._get_map().items()
+
+    def values(self):
+        return self._get_map().values()
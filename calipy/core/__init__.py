@@ -1,5 +1,13 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
 
-from .BaseContext import BaseContext
-from .CalibrationContext import CalibrationContext
+from calipy.lazy import lazy_exports
+
+# Imported on first access, see calipy.lazy
+lazy_exports(__name__, {
+    'BaseContext': 'BaseContext',
+    'CalibrationContext': 'CalibrationContext',
+    'FrameCache': 'FrameCache',
+    'FramePrefetcher': 'FramePrefetcher',
+    'LazyMap': 'LazyMap',
+})
@@ -0,0 +1,52 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import threading
+
+import cv2
+import numpy as np
+
+
+class Board:
+    """ ChArUco board with its marker dictionary and chessboard corners """
+
+    DICTIONARIES = {4: cv2.aruco.DICT_4X4_1000,
+                    5: cv2.aruco.DICT_5X5_1000,
+                    6: cv2.aruco.DICT_6X6_1000,
+                    7: cv2.aruco.DICT_7X7_1000}
+
+    def __init__(self, board_size, marker_size, dictionary):
+        self.board_size = board_size
+        self.marker_size = marker_size
+
+        self.dictionary_id = self.DICTIONARIES[dictionary]
+        self.dictionary = cv2.aruco.getPredefinedDictionary(self.dictionary_id)
+        self.board = cv2.aruco.CharucoBoard(board_size, *marker_size, self.dictionary)
+        self.chessboard_corners = self.board.getChessboardCorners()
+
+        self.num_feats = (board_size[0] - 1) * (board_size[1] - 1)
+        self.min_det_feats = int(max(board_size))
+
+
+class BoardRegistry:
+    """ Process wide registry creating each board only once """
+
+    _boards = {}  # key > Board
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_key(board_params):
+        """ Return hashable key of board parameters """
+        return tuple(np.asarray(board_params[name][0]).item()
+                     for name in ('square_x', 'square_y', 'square_length', 'marker_length', 'dictionary'))
+
+    @classmethod
+    def get_board(cls, board_params):
+        """ Get board of board parameters, creating it on first use """
+        key = cls.get_key(board_params)
+
+        with cls._lock:
+            if key not in cls._boards:
+                cls._boards[key] = Board(key[0:2], key[2:4], key[4])
+
+            return cls._boards[key]
@@ -1,12 +1,32 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
 
+import logging
 import math
-from collections import OrderedDict
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 
 import cv2
 import numpy as np
 
+from .BoardRegistry import BoardRegistry
+
+logger = logging.getLogger(__name__)
+
+# Detector of the current worker process, see ChArucoDetector.detect_recording
+_worker_detector = None
+
+
+def _init_worker(board_params):
+    global _worker_detector
+    _worker_detector = ChArucoDetector(None)
+    _worker_detector.configure(board_params)
+
+
+def _detect_worker(frame):
+    return _worker_detector.detect(frame)
+
 
 class ChArucoDetector:
     ID = "charuco"
@@ -33,7 +53,24 @@ class ChArucoDetector:
         self.params = cv2.aruco.DetectorParameters()
         self.params.cornerRefinementMethod = cv2.aruco.CORNER_REFINE_SUBPIX
 
+        self.board_params = None
+        self.charuco_detector = None
+
+    def get_board_params(self):
+        """ Return board parameters of current settings """
+        if self.board_params is not None:
+            return self.board_params
+
+        return OrderedDict([(p['name'], (p['value'], OrderedDict())) for p in self.PARAMS])
+
     def configure(self, board_params):
+        # Nothing to do if board is unchanged
+        if self.board_params is not None and BoardRegistry.get_key(board_params) == \
+                BoardRegistry.get_key(self.board_params):
+            return
+
+        self.board_params = board_params
+
         self.board_size = (board_params['square_x'][0], board_params['square_y'][0])
         self.PARAMS[0]['value'] = board_params['square_x'][0]
         self.PARAMS[1]['value'] = board_params['square_y'][0]
@@ -42,16 +79,88 @@ class ChArucoDetector:
         self.PARAMS[2]['value'] = board_params['square_length'][0]
         self.PARAMS[3]['value'] = board_params['marker_length'][0]
 
-        dictionary_id = {4: cv2.aruco.DICT_4X4_1000,
-                         5: cv2.aruco.DICT_5X5_1000,
-                         6: cv2.aruco.DICT_6X6_1000,
-                         7: cv2.aruco.DICT_7X7_1000}[board_params['dictionary'][0]]
+        board = BoardRegistry.get_board(board_params)
+        self.dictionary = board.dictionary
+        self.board = board.board
 
-        self.dictionary = cv2.aruco.getPredefinedDictionary(dictionary_id)
-        self.board = cv2.aruco.CharucoBoard(self.board_size, *self.marker_size, self.dictionary)
+        self.num_feats = board.num_feats
+        self.min_det_feats = board.min_det_feats
 
-        self.num_feats = (self.board_size[0] - 1) * (self.board_size[1] - 1)
-        self.min_det_feats = int(max(self.board_size))
+        self.charuco_detector = cv2.aruco.CharucoDetector(self.board, cv2.aruco.CharucoParameters(), self.params)
+
+    def detect(self, frame, offset=(0, 0)):
+        """ Detect board in frame, return None if no chessboard corner was found """
+        if frame.ndim > 2 and frame.shape[2] > 1:
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+
+        square_corners, square_ids, marker_corners, marker_ids = self.charuco_detector.detectBoard(frame)
+
+        if square_ids is None or not len(square_ids):
+            return None
+
+        # Chessboard corners are stored in sensor coordinates, like calibcam results
+        return {'square_ids': square_ids.reshape(-1, 1),
+                'square_corners': square_corners.reshape(-1, 1, 2) + np.asarray(offset, dtype=np.float32),
+                'marker_ids': marker_ids,
+                'marker_corners': marker_corners}
+
+    def detect_recording(self, reader, start=0, stop=None, step=1, offset=(0, 0), processes=None,
+                         progress=None, skip=(), on_chunk=None, chunk_size=1000):
+        """ Detect board in frames [start, stop) of reader with stride step, using a pool of processes
+
+        Frames are read sequentially in this process and detected in worker processes, each holding their own
+        configured detector. Frames in skip are not processed. Every chunk_size processed frames, on_chunk is
+        called with the map of frame index to detection (None if nothing was detected) of these frames.
+        Returns map of frame index to detection for frames with detected corners.
+        """
+        n_frames = reader.n_frames
+        stop = n_frames if stop is None else min(stop, n_frames)
+        skip = set(skip)
+        indices = [i for i in range(start, stop, step) if i not in skip]
+
+        processes = processes or os.cpu_count()
+        # Limit frames in flight to bound memory use
+        max_pending = 2 * processes
+
+        detections = {}
+        chunk = {}
+        pending = deque()
+        done = 0
+
+        def collect():
+            nonlocal done, chunk
+            frm_idx, future = pending.popleft()
+            detection = future.result()
+            if detection is not None:
+                detection['square_corners'] += np.asarray(offset, dtype=np.float32)
+                detections[frm_idx] = detection
+
+            chunk[frm_idx] = detection
+            if on_chunk is not None and len(chunk) >= chunk_size:
+                on_chunk(chunk)
+                chunk = {}
+
+            done += 1
+            if progress is not None:
+                progress(done, len(indices))
+
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(self.get_board_params(),)) as pool:
+            for frm_idx in indices:
+                pending.append((frm_idx, pool.submit(_detect_worker, reader.get_data(frm_idx))))
+
+                while len(pending) >= max_pending:
+                    collect()
+
+            while pending:
+                collect()
+
+        if on_chunk is not None and chunk:
+            on_chunk(chunk)
+
+        logger.log(logging.INFO, f"Detected board in {len(detections)} of {len(indices)} frames")
+
+        return detections
 
     @staticmethod
     def board_params_calipy(calibcam_dict):
@@ -91,16 +200,15 @@ class ChArucoDetector:
         return {'object_pts': object_pts, 'image_pts': image_pts, 'square_ids': square_ids}
 
     @staticmethod
-    def draw(frame, detected, offset=(0, 0)):
+    def get_overlay(detected, offset=(0, 0)):
+        """ Return detection as vector data in image coordinates """
+        overlay = {}
 
         if 'marker_corners' in detected:
-            # Draw detected markers (aruco corners)
-            cv2.aruco.drawDetectedMarkers(frame, detected['marker_corners'])
+            overlay['marker_corners'] = [np.asarray(corners).reshape(-1, 2) for corners in detected['marker_corners']]
 
         if 'square_corners' in detected:
-            # Draw detected squares (charuco corners)
-            cv2.aruco.drawDetectedCornersCharuco(frame,
-                                                 np.asarray(detected['square_corners'], dtype=np.float32)
-                                                 - np.asarray(offset))
+            overlay['square_corners'] = (np.asarray(detected['square_corners'], dtype=np.float32).reshape(-1, 2)
+                                         - np.asarray(offset))
 
-        return frame
+        return overlay
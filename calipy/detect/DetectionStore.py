@@ -0,0 +1,168 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import hashlib
+import logging
+import os
+import shutil
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from .DetectionTable import DetectionTable
+
+logger = logging.getLogger(__name__)
+
+
+class DetectionStore:
+    """ Append-only on-disk store of the detections of one source, written in chunks
+
+    Each chunk holds the processed frame indices with the number of detected corners per frame, so frames
+    without detection are remembered as processed and an interrupted run can be resumed.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    @classmethod
+    def for_source(cls, cache_dir, det_id, src_id):
+        # Source identifiers may contain pipelines, which are not valid file names
+        key = src_id if src_id.isalnum() else hashlib.md5(src_id.encode()).hexdigest()
+        return cls(Path(cache_dir) / "detections" / det_id / key)
+
+    def exists(self):
+        return any(self.get_chunks())
+
+    def get_chunks(self):
+        if not self.path.is_dir():
+            return []
+
+        return sorted(self.path.glob("chunk_*.npz"))
+
+    def clear(self):
+        """ Remove all stored chunks """
+        for chunk in self.get_chunks():
+            chunk.unlink()
+
+    def move_to(self, path, copy=False):
+        """ Move (or copy) stored chunks to path, replacing chunks stored there, and use the new location """
+        target = DetectionStore(path)
+        if target.path == self.path:
+            return
+
+        target.clear()
+        if self.exists():
+            target.path.mkdir(parents=True, exist_ok=True)
+            for chunk in self.get_chunks():
+                (shutil.copy2 if copy else shutil.move)(chunk, target.path / chunk.name)
+
+        self.path = target.path
+
+    def append(self, detections):
+        """ Write map of frame index to detection (or None for frames without detection) as new chunk """
+        if not detections:
+            return
+
+        frames = np.asarray(sorted(detections.keys()), dtype=np.int64)
+        counts = np.zeros(len(frames), dtype=np.int64)
+        square_ids = []
+        square_corners = []
+
+        for i, frm_idx in enumerate(frames):
+            detection = detections[frm_idx]
+            if detection is None:
+                continue
+
+            counts[i] = len(detection['square_ids'])
+            square_ids.append(np.asarray(detection['square_ids']).reshape(-1))
+            square_corners.append(np.asarray(detection['square_corners']).reshape(-1, 2))
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        chunks = self.get_chunks()
+        index = int(chunks[-1].stem.split('_')[1]) + 1 if chunks else 0
+
+        # Write to temporary file first, so an interrupted write never leaves a broken chunk
+        path = self.path / f"chunk_{index:06d}.npz"
+        tmp_path = self.path / f"tmp_{index:06d}.npz"
+        np.savez(tmp_path,
+                 frames=frames,
+                 counts=counts,
+                 square_ids=np.concatenate(square_ids) if square_ids else np.zeros(0, dtype=np.int64),
+                 square_corners=np.concatenate(square_corners) if square_corners else np.zeros((0, 2)))
+        os.replace(tmp_path, path)
+
+    def get_processed_frames(self):
+        """ Return set of frame indices that were already processed """
+        processed = set()
+        for chunk in self.get_chunks():
+            with np.load(chunk) as data:
+                processed.update(data['frames'].tolist())
+
+        return processed
+
+    def load(self):
+        """ Load DetectionTable of all stored frames, skipping frames without detection """
+        columns = {'frames': [], 'counts': [], 'square_ids': [], 'square_corners': []}
+        for chunk in self.get_chunks():
+            with np.load(chunk) as data:
+                for name, column in columns.items():
+                    column.append(data[name])
+
+        if not columns['frames']:
+            return DetectionTable()
+
+        columns = {name: np.concatenate(column) for name, column in columns.items()}
+        detected = columns['counts'] > 0
+
+        return DetectionTable.from_ragged(columns['frames'][detected], columns['counts'][detected],
+                                          columns['square_ids'], columns['square_corners'])
+
+    @staticmethod
+    def save_board_params(cache_dir, det_id, board_params):
+        path = Path(cache_dir) / "detections" / det_id / "board_params.yml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as file:
+            yaml.safe_dump({name: np.asarray(value[0]).item() for name, value in board_params.items()}, file)
+
+    @staticmethod
+    def load_board_params(cache_dir, det_id):
+        """ Return board parameters stored with detections, or None """
+        path = Path(cache_dir) / "detections" / det_id / "board_params.yml"
+        if not path.exists():
+            return None
+
+        with open(path, 'r') as file:
+            return OrderedDict([(name, (value, OrderedDict())) for name, value in yaml.safe_load(file).items()])
+
+
+class LazyDetections(Mapping):
+    """ Read-only frame index to detection map, loaded from a DetectionStore on first access """
+
+    def __init__(self, store):
+        self.store = store
+        self._table = None
+
+    def get_table(self):
+        if self._table is None:
+            logger.log(logging.INFO, f"Loading stored detections: {self.store.path}")
+            self._table = self.store.load()
+
+        return self._table
+
+    def __contains__(self, frm_idx):
+        return frm_idx in self.get_table()
+
+    def __getitem__(self, frm_idx):
+        return self.get_table()[frm_idx]
+
+    def __iter__(self):
+        return iter(self.get_table())
+
+    def __len__(self):
+        return len(self.get_table())
+
+    def counts(self):
+        return self.get_table().counts()
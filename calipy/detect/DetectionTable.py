@@ -0,0 +1,125 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+class DetectionTable(MutableMapping):
+    """ Columnar detections of one source
+
+    Holds sorted frame indices and a [n_frames, n_corners, 2] corner tensor, with NaN for undetected corners.
+    Behaves like a map of frame index to {'square_ids', 'square_corners'} detection dicts.
+    """
+
+    def __init__(self, frames=None, corners=None, n_corners=0):
+        if frames is None:
+            frames = np.zeros(0, dtype=np.int64)
+            corners = np.full((0, n_corners, 2), np.nan)
+
+        frames = np.asarray(frames, dtype=np.int64)
+        corners = np.asarray(corners)
+
+        # Keep corners as they are if already sorted, e.g. to not load memory-mapped results
+        if np.any(np.diff(frames) < 0):
+            order = np.argsort(frames, kind='stable')
+            frames = frames[order]
+            corners = corners[order]
+
+        self.frames = frames
+        self.corners = corners
+
+    @classmethod
+    def from_detections(cls, detections, n_corners=0):
+        """ Create table from map of frame index to detection dict """
+        detections = {frm_idx: d for frm_idx, d in detections.items() if d is not None}
+
+        for detection in detections.values():
+            if len(detection['square_ids']):
+                n_corners = max(n_corners, int(np.max(detection['square_ids'])) + 1)
+
+        table = cls(n_corners=n_corners)
+        for frm_idx, detection in detections.items():
+            table[frm_idx] = detection
+
+        return table
+
+    @classmethod
+    def from_ragged(cls, frames, counts, square_ids, square_corners, n_corners=0):
+        """ Create table from concatenated corners of all frames, with counts corners per frame """
+        square_ids = np.asarray(square_ids, dtype=np.int64).reshape(-1)
+        if len(square_ids):
+            n_corners = max(n_corners, int(square_ids.max()) + 1)
+
+        corners = np.full((len(frames), n_corners, 2), np.nan)
+        rows = np.repeat(np.arange(len(frames)), counts)
+        corners[rows, square_ids] = np.asarray(square_corners).reshape(-1, 2)
+
+        return cls(frames, corners)
+
+    @property
+    def n_corners(self):
+        return self.corners.shape[1]
+
+    def _row(self, frm_idx):
+        row = np.searchsorted(self.frames, frm_idx)
+        if row < len(self.frames) and self.frames[row] == frm_idx:
+            return row
+
+        return None
+
+    def __contains__(self, frm_idx):
+        return self._row(frm_idx) is not None
+
+    def __getitem__(self, frm_idx):
+        row = self._row(frm_idx)
+        if row is None:
+            raise KeyError(frm_idx)
+
+        corners = self.corners[row]
+        square_ids = np.flatnonzero(~np.isnan(corners).any(axis=1))
+
+        return {'square_ids': square_ids.reshape(-1, 1),
+                'square_corners': corners[square_ids].reshape(-1, 1, 2)}
+
+    def __setitem__(self, frm_idx, detection):
+        square_ids = np.asarray(detection['square_ids'], dtype=np.int64).reshape(-1)
+        square_corners = np.asarray(detection['square_corners']).reshape(-1, 2)
+
+        # Modifications always work on an in-memory copy
+        if not self.corners.flags.writeable:
+            self.corners = np.array(self.corners)
+
+        # Grow corner dimension if necessary
+        if len(square_ids) and square_ids.max() >= self.n_corners:
+            padding = np.full((len(self.frames), square_ids.max() + 1 - self.n_corners, 2), np.nan)
+            self.corners = np.concatenate([self.corners, padding], axis=1)
+
+        row = self._row(frm_idx)
+        if row is None:
+            row = np.searchsorted(self.frames, frm_idx)
+            self.frames = np.insert(self.frames, row, frm_idx)
+            self.corners = np.insert(self.corners, row, np.nan, axis=0)
+        else:
+            self.corners[row] = np.nan
+
+        self.corners[row, square_ids] = square_corners
+
+    def __delitem__(self, frm_idx):
+        row = self._row(frm_idx)
+        if row is None:
+            raise KeyError(frm_idx)
+
+        self.frames = np.delete(self.frames, row)
+        self.corners = np.delete(self.corners, row, axis=0)
+
+    def __iter__(self):
+        return iter(self.frames.tolist())
+
+    def __len__(self):
+        return len(self.frames)
+
+    def counts(self):
+        """ Return number of detected corners per frame """
+        return np.count_nonzero(~np.isnan(self.corners).any(axis=2), axis=1)
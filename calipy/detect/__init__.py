@@ -1,4 +1,14 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
 
-from .ChArucoDetector import ChArucoDetector
+from calipy.lazy import lazy_exports
+
+# Imported on first access, see calipy.lazy
+lazy_exports(__name__, {
+    'Board': 'BoardRegistry',
+    'BoardRegistry': 'BoardRegistry',
+    'ChArucoDetector': 'ChArucoDetector',
+    'DetectionStore': 'DetectionStore',
+    'LazyDetections': 'DetectionStore',
+    'DetectionTable': 'DetectionTable',
+})
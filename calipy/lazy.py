@@ -0,0 +1,57 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import importlib
+import sys
+import types
+
+
+class LazyPackage(types.ModuleType):
+    """ Package importing its exports and submodules on first access, see lazy_exports """
+
+    def __getattr__(self, name):
+        exports = self.__dict__.get('_lazy_exports', {})
+        submodules = self.__dict__.get('_lazy_submodules', ())
+
+        if name in submodules:
+            # Importing binds the submodule in the package
+            return importlib.import_module(f"{self.__name__}.{name}")
+
+        if name not in exports:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+
+        value = getattr(importlib.import_module(f"{self.__name__}.{exports[name]}"), name)
+        self.__dict__[name] = value
+
+        return value
+
+    def __setattr__(self, name, value):
+        # Importing a submodule binds it in the package, which must not shadow the export of the same name,
+        # as most classes are named like their module
+        exports = self.__dict__.get('_lazy_exports', {})
+        if (isinstance(value, types.ModuleType) and name in exports
+                and value.__name__ == f"{self.__name__}.{exports[name]}" and hasattr(value, name)):
+            value = getattr(value, name)
+
+        super().__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self.__dict__.get('_lazy_exports', {}))
+                      | set(self.__dict__.get('_lazy_submodules', ())))
+
+
+def lazy_exports(package, exports, submodules=()):
+    """ Have package import exports {name: submodule} and submodules on first access
+
+    Call from the package's __init__ with its __name__.
+    """
+    module = sys.modules[package]
+    module.__dict__['_lazy_exports'] = dict(exports)
+    module.__dict__['_lazy_submodules'] = tuple(submodules)
+    module.__class__ = LazyPackage
+
+    # Submodules imported before, e.g. while importing the package itself, are replaced by their exports
+    for name in exports:
+        value = module.__dict__.get(name, None)
+        if isinstance(value, types.ModuleType):
+            setattr(module, name, value)
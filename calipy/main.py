@@ -26,6 +26,8 @@ def main():
                              "The final output of the pipeline is used to display calibration.")
     parser.add_argument("--calib_file", type=str, required=False, nargs=1, default=[None],
                         help="calibration .yml or .npy file generated by calibcam")
+    parser.add_argument("--frame_cache_mb", type=int, required=False, default=4096,
+                        help="memory budget in MB for decoded frames shared by all cameras")
     parser.add_argument('-log', '--loglevel', default='info', help='Provide logging level')
 
     config = parser.parse_args()
@@ -34,7 +36,7 @@ def main():
     app = QApplication([])
     app.setApplicationDisplayName(parser.prog)
 
-    context = core.CalibrationContext()
+    context = core.CalibrationContext(frame_cache=core.FrameCache(config.frame_cache_mb * 2 ** 20))
 
     gui = ui.MainWindow(context)
     gui.resize(QApplication.primaryScreen().availableSize())
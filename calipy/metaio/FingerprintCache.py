@@ -0,0 +1,139 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from .utils import cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Distinguishes fingerprints from MD5 hashes of older system files
+FINGERPRINT_PREFIX = "fp1-"
+
+
+def fingerprint(url, block_size=65536, n_blocks=16):
+    """ Hash file size and blocks sampled evenly across the file """
+    size = os.path.getsize(url)
+    hash_fun = hashlib.blake2b(digest_size=16)
+    hash_fun.update(size.to_bytes(8, 'little'))
+
+    with open(url, 'rb') as f:
+        if size <= block_size * n_blocks:
+            hash_fun.update(f.read())
+        else:
+            step = (size - block_size) // (n_blocks - 1)
+            for i in range(n_blocks):
+                f.seek(i * step)
+                hash_fun.update(f.read(block_size))
+
+    return FINGERPRINT_PREFIX + hash_fun.hexdigest()
+
+
+class FingerprintCache:
+    """ Fingerprints of files, stored in a sidecar file and valid as long as the file is not modified """
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None  # abs path > {'inode', 'size', 'mtime', 'hash'}
+        self._changed = {}  # Entries computed since the last save
+
+    @classmethod
+    def get_default(cls):
+        """ Get cache shared by all recordings, stored in the user cache directory """
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls(cache_dir() / "fingerprints.yml")
+
+            return cls._default
+
+    def _read(self):
+        """ Return entries currently stored in the file """
+        if not self.path.exists():
+            return {}
+
+        try:
+            with open(self.path, 'r') as file:
+                return yaml.safe_load(file) or {}
+        except (OSError, yaml.YAMLError) as e:
+            logger.log(logging.WARNING, f"Ignoring broken fingerprint cache {self.path}: {e}")
+            return {}
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read()
+
+    def save(self):
+        """ Merge computed entries into the file, which other processes may have updated meanwhile """
+        with self._lock:
+            if not self._changed:
+                return
+
+            self._entries = dict(self._read(), **self._changed)
+
+            # Write to temporary file first, so concurrent readers never see a partially written file
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp_path, 'w') as file:
+                    yaml.safe_dump(self._entries, file)
+                os.replace(tmp_path, self.path)
+                self._changed = {}
+            except OSError as e:
+                logger.log(logging.WARNING, f"Could not store fingerprint cache {self.path}: {e}")
+                if tmp_path.exists():
+                    tmp_path.unlink()
+
+    def _lookup(self, url):
+        """ Return (key, stat entry, cached fingerprint or None) """
+        key = os.path.abspath(url)
+        stat = os.stat(url)
+        entry = {'inode': stat.st_ino, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+        with self._lock:
+            self._load()
+            cached = self._entries.get(key, {})
+
+        if all(cached.get(name, None) == value for name, value in entry.items()):
+            return key, entry, cached['hash']
+
+        return key, entry, None
+
+    def _compute(self, url):
+        key, entry, hash = self._lookup(url)
+
+        if hash is None:
+            hash = fingerprint(url)
+            with self._lock:
+                self._entries[key] = self._changed[key] = dict(entry, hash=hash)
+
+            return hash, True
+
+        return hash, False
+
+    def get(self, url):
+        """ Get fingerprint of file, computing it if the file is unknown or modified """
+        hash, computed = self._compute(url)
+
+        if computed:
+            self.save()
+
+        return hash
+
+    def get_many(self, urls, max_workers=None):
+        """ Get fingerprints of several files, computed in parallel """
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="calipy-hash") as executor:
+            results = list(executor.map(self._compute, urls))
+
+        if any(computed for _, computed in results):
+            self.save()
+
+        return [hash for hash, _ in results]
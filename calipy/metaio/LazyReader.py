@@ -0,0 +1,32 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import threading
+
+
+class LazyReader:
+    """ Reader proxy that constructs the reader on first use """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def get_reader(self):
+        """ Get wrapped reader, constructing it if necessary """
+        with self._lock:
+            if self._reader is None:
+                self._reader = self._factory()
+                self._factory = None
+
+            return self._reader
+
+    def is_constructed(self):
+        return self._reader is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get_reader(), name)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
@@ -2,17 +2,26 @@
 # SPDX-License-Identifier: LGPL-2.1
 
 import logging
+from functools import partial
 from pathlib import Path
 
 import yaml
-from svidreader import filtergraph
 
+from .FingerprintCache import FingerprintCache, FINGERPRINT_PREFIX, fingerprint
+from .LazyReader import LazyReader
+from .SeekIndex import SeekIndex, IndexedReader, import_av
 from .utils import filehash
 
 logger = logging.getLogger(__name__)
 
 
 class Recording(yaml.YAMLObject):
+    # Metadata is probed once and stored in the system file, older system files lack it
+    offset = None
+    n_frames = None
+    fps = None
+    resolution = None  # (width, height) of decoded frames
+    dtype = None  # Numpy type name of decoded frames
 
     def __init__(self, url, hash=None, pipeline=None):
         self.url = url
@@ -21,21 +30,64 @@ class Recording(yaml.YAMLObject):
         self.hash = hash
         self.filter = None
         self.offset = None
+        self.n_frames = None
+        self.fps = None
+        self.resolution = None
+        self.dtype = None
+
+    def init_reader(self, cache_dir=None, lazy=False):
+        """ Open reader of recording, using a seek index stored in cache_dir for random access if possible
+
+        If lazy, building the pipeline is postponed until the reader is first used.
+        """
+        # Without metadata, the reader has to be built to probe it
+        if lazy and self.pipeline is not None and self.has_metadata():
+            return LazyReader(partial(self.init_reader, cache_dir))
+
+        # Importing svidreader is slow, and not needed to read and write system files
+        from svidreader import filtergraph
 
-    def init_reader(self):
-        """"""
         logger.log(logging.INFO, f"Loading recording: {self.url}")
         reader = filtergraph.get_reader(self.url, cache=False, backend='iio')
         if self.pipeline is not None:
             logger.log(logging.INFO, f"The recording pipeline is {self.pipeline}")
             reader = filtergraph.create_filtergraph_from_string([reader],
                                                                 pipeline=self.pipeline)['out']
-        self.offset = self.get_offset_from_reader(reader)
+        elif cache_dir is not None:
+            # Pipelines bring their own frame access, so only plain recordings are indexed.
+            # Indexing reads the whole file, so an uncached index is built in the background.
+            if import_av() is not None:
+                index = SeekIndex.load_cached(self.get_hash(), cache_dir)
+                build_index = None
+                if index is None:
+                    build_index = partial(SeekIndex.for_recording, self.url, self.get_hash(), cache_dir)
+                reader = IndexedReader(reader, self.url, index, build_index=build_index)
+        if not self.has_metadata():
+            self.probe_metadata(reader)
         return reader
 
+    def has_metadata(self):
+        """ Check if header metadata was probed already """
+        return self.offset is not None and self.n_frames is not None
+
+    def probe_metadata(self, reader):
+        """ Store header metadata of recording from its reader """
+        header = reader.get_meta_data()
+        self.offset = self.get_offset_from_header(header)
+        self.n_frames = reader.n_frames
+        self.fps = header.get('fps', None)
+
+    def set_frame_format(self, frame):
+        """ Store resolution and type of recording from a decoded frame """
+        self.resolution = (frame.shape[1], frame.shape[0])
+        self.dtype = str(frame.dtype)
+
     @staticmethod
     def get_offset_from_reader(reader):
-        header = reader.get_meta_data()
+        return Recording.get_offset_from_header(reader.get_meta_data())
+
+    @staticmethod
+    def get_offset_from_header(header):
         # Add required headers that are not normally part of standard video formats but are required information
         # for a full calibration
         # TODO add option to supply this via options. Currently, compressed videos may lack this info
@@ -48,13 +100,17 @@ class Recording(yaml.YAMLObject):
             return tuple([0, 0])
 
     def _compute_hash(self):
-        """" Compute hash of file behind current url """
-        return filehash(self.url)
+        """" Compute hash of file behind current url, with the method the known hash was computed with """
+        if self.hash is not None and not self.hash.startswith(FINGERPRINT_PREFIX):
+            # MD5 hashes of older system files stay valid
+            return filehash(self.url)
+
+        return fingerprint(self.url)
 
     def get_hash(self):
         """' Get hash of file or compute it if unknown """
         if self.hash is None:
-            self.hash = self._compute_hash()
+            self.hash = FingerprintCache.get_default().get(self.url)
 
         return self.hash
 
@@ -69,8 +125,8 @@ class Recording(yaml.YAMLObject):
 
     def get_sensor_offset(self):
         if self.offset is None:
-            # this is a bit circular, find a better way.
-            self.offset = self.get_offset_from_reader(self.init_reader())
+            # Only recordings that were never opened lack metadata, probe it once
+            self.init_reader().close()
         return self.offset
 
 
@@ -88,3 +144,12 @@ class Session(yaml.YAMLObject):
 
     def remove_recording(self, id):
         del self.recordings[id]
+
+    def compute_hashes(self):
+        """ Compute unknown hashes of all recordings in parallel """
+        missing = [rec for rec in self.recordings.values() if rec.hash is None]
+
+        if missing:
+            hashes = FingerprintCache.get_default().get_many([rec.url for rec in missing])
+            for rec, hash in zip(missing, hashes):
+                rec.hash = hash
@@ -0,0 +1,205 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def import_av():
+    """ Import optional PyAV on first use, None if not installed """
+    try:
+        import av
+    except ImportError:
+        return None
+
+    return av
+
+
+class SeekIndex:
+    """ Map of frames to presentation timestamps and keyframes of a video file """
+
+    def __init__(self, pts, keyframes, positions):
+        self.pts = pts  # frm_idx > presentation timestamp, in display order
+        self.keyframes = keyframes  # sorted frame indices of keyframes
+        self.positions = positions  # frm_idx > byte offset of packet in file (-1 if unknown)
+
+    @property
+    def n_frames(self):
+        return len(self.pts)
+
+    def keyframe_of(self, index):
+        """ Return index of the last keyframe at or before the supplied frame """
+        return int(self.keyframes[max(np.searchsorted(self.keyframes, index, side='right') - 1, 0)])
+
+    def frame_of_pts(self, pts):
+        """ Return frame index of presentation timestamp """
+        return int(np.searchsorted(self.pts, pts))
+
+    @classmethod
+    def build(cls, url, stop=None):
+        """ Scan packets of video file (without decoding) to build index, None if the stop event is set meanwhile """
+        pts = []
+        keyframe = []
+        positions = []
+
+        with import_av().open(str(url)) as container:
+            stream = container.streams.video[0]
+
+            for packet in container.demux(stream):
+                if stop is not None and stop.is_set():
+                    return None
+
+                # Skip flush packets
+                if packet.pts is None:
+                    continue
+
+                pts.append(packet.pts)
+                keyframe.append(packet.is_keyframe)
+                positions.append(packet.pos if packet.pos is not None else -1)
+
+        # Packets are in decoding order, frames are in presentation order
+        order = np.argsort(pts, kind='stable')
+
+        return cls(np.asarray(pts, dtype=np.int64)[order],
+                   np.flatnonzero(np.asarray(keyframe, dtype=bool)[order]),
+                   np.asarray(positions, dtype=np.int64)[order])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['pts'], data['keyframes'], data['positions'])
+
+    def save(self, path):
+        np.savez(path, pts=self.pts, keyframes=self.keyframes, positions=self.positions)
+
+    @staticmethod
+    def get_path(hash, cache_dir):
+        return Path(cache_dir) / "seek" / f"{hash}.npz"
+
+    @classmethod
+    def load_cached(cls, hash, cache_dir):
+        """ Load index of recording from cache, None if not cached yet """
+        path = cls.get_path(hash, cache_dir)
+        if not path.exists():
+            return None
+
+        try:
+            return cls.load(path)
+        except (OSError, KeyError, ValueError) as e:
+            logger.log(logging.WARNING, f"Ignoring broken seek index {path}: {e}")
+            return None
+
+    @classmethod
+    def for_recording(cls, url, hash, cache_dir, stop=None):
+        """ Load index of recording from cache, or build and cache it. Return None if it can not be indexed
+
+        Building reads the whole file, it is aborted if the stop event is set.
+        """
+        if import_av() is None:
+            return None
+
+        index = cls.load_cached(hash, cache_dir)
+        if index is not None:
+            return index
+
+        logger.log(logging.INFO, f"Building seek index: {url}")
+        try:
+            index = cls.build(url, stop=stop)
+        except Exception as e:  # PyAV raises various errors on unsupported containers
+            logger.log(logging.INFO, f"Could not index {url}: {e}")
+            return None
+
+        if index is None or not len(index.keyframes):
+            return None
+
+        path = cls.get_path(hash, cache_dir)
+
+        # Write to temporary file first, so an interrupted build never leaves a broken index
+        tmp_path = path.with_name(f"tmp_{os.getpid()}_{threading.get_ident()}_{path.name}")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            index.save(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.log(logging.WARNING, f"Could not store seek index {path}: {e}")
+
+        return index
+
+
+class IndexedReader:
+    """ Reader wrapper that decodes frames by seeking to the closest keyframe from a SeekIndex
+
+    If build_index is supplied instead of an index, it is called with a stop event in a background thread.
+    Until it returns an index, frames are read by the wrapped reader.
+    """
+
+    def __init__(self, reader, url, index=None, build_index=None):
+        self.reader = reader
+        self.url = url
+        self.index = index
+
+        self._container = None  # Opened on first indexed read
+        self._stream = None
+        self._frames = None  # Running decoder
+        self._next = None  # Index of frame the running decoder returns next
+
+        self._stop = threading.Event()
+        self._builder = None
+        if index is None and build_index is not None:
+            self._builder = threading.Thread(target=self._build, args=(build_index,), daemon=True,
+                                             name="calipy-seek-index")
+            self._builder.start()
+
+    def _build(self, build_index):
+        self.index = build_index(self._stop)
+
+    def is_indexed(self):
+        return self.index is not None
+
+    def __getattr__(self, name):
+        # Metadata and everything else is served by the wrapped reader
+        return getattr(self.reader, name)
+
+    def get_data(self, index):
+        seek_index = self.index
+        if seek_index is None or self._stop.is_set():
+            return self.reader.get_data(index)
+
+        if not 0 <= index < seek_index.n_frames:
+            raise IndexError(f"Frame {index} out of range")
+
+        if self._container is None:
+            self._container = import_av().open(str(self.url))
+            self._stream = self._container.streams.video[0]
+            self._stream.thread_type = 'AUTO'
+
+        target = seek_index.pts[index]
+        keyframe = seek_index.keyframe_of(index)
+
+        # Only keep decoding forward if there is no keyframe closer to the requested frame
+        if self._frames is None or index < self._next or keyframe > self._next:
+            self._container.seek(int(seek_index.pts[keyframe]), stream=self._stream, backward=True, any_frame=False)
+            self._frames = self._container.decode(self._stream)
+
+        for frame in self._frames:
+            if frame.pts is None or frame.pts < target:
+                continue
+
+            self._next = seek_index.frame_of_pts(frame.pts) + 1
+            return frame.to_ndarray(format='rgb24')
+
+        self._frames = None
+        raise IndexError(f"Frame {index} could not be decoded")
+
+    def close(self):
+        # An index still being built is not needed anymore, it is built again on next open
+        self._stop.set()
+        if self._container is not None:
+            self._container.close()
+        self.reader.close()
@@ -4,5 +4,8 @@
 """CaliPy module to handle meta data files"""
 
 from .CameraSystem import Camera, CameraSystem
+from .FingerprintCache import FingerprintCache, fingerprint
+from .LazyReader import LazyReader
 from .RecordingSession import Recording, Session
-from .utils import filehash
+from .SeekIndex import SeekIndex, IndexedReader
+from .utils import filehash, cache_dir
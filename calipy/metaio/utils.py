@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: LGPL-2.1
 
 import hashlib
+import os
+from pathlib import Path
 
 
 def filehash(url):
@@ -16,3 +18,14 @@ def filehash(url):
             buffer = f.read(block_size)
             count += 1
     return hash_fun.hexdigest()
+
+
+def cache_dir(system_path=None):
+    """ Directory for derived data, next to the system file if known or in the user cache otherwise """
+    if system_path is not None:
+        # e.g. rig.system.yml > rig.cache, dots in the name are kept so rig.a and rig.b do not share a cache
+        path = Path(system_path)
+        name = path.name[:-len(".system.yml")] if path.name.endswith(".system.yml") else path.stem
+        return path.parent / (name + ".cache")
+
+    return Path(os.environ.get('XDG_CACHE_HOME', Path.home() / ".cache")) / "calipy"
@@ -0,0 +1,142 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import argparse
+import csv
+import json
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from calibcamlib import Camerasystem as cs
+
+from . import core
+
+logger = logging.getLogger(__name__)
+
+CSV_FIELDS = ['calib_file', 'camera', 'detections', 'corners', 'single_estimations', 'error',
+              'system_mean_err', 'system_med_err', 'system_max_err']
+
+
+def create_report(calib_file, system_file=None, videos=None, pipelines=None, plot_dir=None):
+    """ Compute detection and calibration statistics of a calibcam result """
+    calib_dict = cs.load_dict(calib_file)
+
+    # Statistics only need the recordings' source identifiers, so no video is opened
+    context = core.CalibrationContext(open_readers=False)
+    try:
+        if system_file is not None:
+            context.load(system_file)
+        elif videos is not None:
+            context.open_videos(videos, pipelines=pipelines)
+        elif 'rec_file_names' in calib_dict:
+            context.open_videos(calib_dict['rec_file_names'], pipelines=calib_dict.get('rec_pipelines', None))
+        else:
+            raise RuntimeError("No video information provided")
+
+        context.load_calibration(calib_dict)
+
+        det_stats = context.get_detection_stats()
+        cameras = {}
+        for cam_id, stats in context.get_calibration_stats().items():
+            cameras[cam_id] = {
+                'detections': stats['detections'],
+                'corners': det_stats.get(cam_id, (0, 0))[1],
+                'single_estimations': stats['single_estimations'],
+                'error': float(stats['error']),
+            }
+
+            if 'system_errors' in stats:
+                cameras[cam_id].update(zip(['system_mean_err', 'system_med_err', 'system_max_err'],
+                                           map(float, stats['system_errors'])))
+
+        if plot_dir is not None:
+            # Plots are only ever written to files
+            import matplotlib
+            matplotlib.use('Agg')
+
+            Path(plot_dir).mkdir(parents=True, exist_ok=True)
+            context.plot_system_calibration_errors(file=Path(plot_dir) / f"{Path(calib_file).stem}.errors.png")
+    finally:
+        context.close()
+
+    return {'calib_file': str(calib_file), 'cameras': cameras}
+
+
+def _create_report_safe(calib_file, **kwargs):
+    """ Report failures per file instead of aborting the whole batch """
+    try:
+        return create_report(calib_file, **kwargs)
+    except Exception as e:
+        logger.log(logging.ERROR, f"{calib_file}: {e}")
+        return {'calib_file': str(calib_file), 'error': str(e)}
+
+
+def write_csv(reports, file):
+    with open(file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+
+        for report in reports:
+            for cam_id, stats in report.get('cameras', {}).items():
+                writer.writerow(dict(stats, calib_file=report['calib_file'], camera=cam_id))
+
+
+def main():
+    """Write calibration quality reports of calibcam results without GUI"""
+
+    parser = argparse.ArgumentParser(prog="calipy-report")
+
+    parser.add_argument('calib_files', type=str, nargs='+',
+                        help="calibration .yml or .npy files generated by calibcam")
+    parser.add_argument('--system_file', type=str, required=False, default=None,
+                        help="yml file (*.system.yml) with sources and recording file paths, "
+                             "by default the recordings referenced in each calib file are used")
+    parser.add_argument('--videos', type=str, required=False, nargs='*', default=None,
+                        help="Add video files directly instead of a system file")
+    parser.add_argument('--pipelines', type=str, required=False, nargs='*', default=None,
+                        help="Add pipelines readable by bbo-svidreader, one per video or one for all")
+    parser.add_argument('--json', type=str, required=False, default=None,
+                        help="JSON file to write reports to, printed if neither --json nor --csv is supplied")
+    parser.add_argument('--csv', type=str, required=False, default=None,
+                        help="CSV file to write one row per calibration file and camera to")
+    parser.add_argument('--plots', type=str, required=False, default=None,
+                        help="Directory to save system calibration error plots to")
+    parser.add_argument('--processes', type=int, required=False, default=None,
+                        help="Number of calibration files processed in parallel, defaults to the CPU count")
+    parser.add_argument('-log', '--loglevel', default='warning', help='Provide logging level')
+
+    config = parser.parse_args()
+    logging.basicConfig(level=config.loglevel.upper())
+
+    pipelines = config.pipelines
+    if config.videos is not None and pipelines is not None and len(pipelines) != len(config.videos):
+        if len(pipelines) != 1:
+            parser.error(f"The number of pipelines ({len(pipelines)}) "
+                         f"does not match the number of videos ({len(config.videos)})")
+        pipelines = pipelines * len(config.videos)
+
+    create = partial(_create_report_safe, system_file=config.system_file, videos=config.videos,
+                     pipelines=pipelines, plot_dir=config.plots)
+
+    # Every calibration file gets its own process and context
+    if config.processes == 1 or len(config.calib_files) == 1:
+        reports = list(map(create, config.calib_files))
+    else:
+        with ProcessPoolExecutor(max_workers=config.processes) as executor:
+            reports = list(executor.map(create, config.calib_files))
+
+    if config.json is not None:
+        with open(config.json, 'w') as file:
+            json.dump(reports, file, indent=2)
+
+    if config.csv is not None:
+        write_csv(reports, config.csv)
+
+    if config.json is None and config.csv is None:
+        json.dump(reports, sys.stdout, indent=2)
+        print()
+
+    return 1 if any('error' in report for report in reports) else 0
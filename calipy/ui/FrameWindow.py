@@ -1,17 +1,81 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
 
-import imageio
+import math
+
 import numpy as np
 from PyQt5 import QtGui, QtCore, QtWidgets
 from PyQt5.Qt import Qt, QStyle, QSizePolicy
-from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtWidgets import QGraphicsScene, QGraphicsPixmapItem
-from PyQt5.QtWidgets import QMainWindow, QToolBar, QGraphicsView
+from PyQt5.QtCore import QPointF, QRectF
+from PyQt5.QtGui import QImage, QPainter, QPainterPath, QPen, QColor, QPolygonF
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsItem, QGraphicsPathItem
+from PyQt5.QtWidgets import QMainWindow, QToolBar, QGraphicsView, QComboBox
 from PyQt5.QtWidgets import QMdiSubWindow, QFileDialog
 
 
+# Lookup tables mapping 16-bit sensor values of a given bit depth to 8 bit
+_LUTS = {}
+
+
+def to_uint8(frame, out, bits=16):
+    """ Convert frame for display, writing into out
+
+    16-bit frames have the supplied number of significant bits, float frames are normalized to [0, 1].
+    The mapping never depends on the frame content, so brightness is stable over time.
+    """
+    if frame.dtype == np.uint8:
+        np.copyto(out, frame)
+    elif frame.dtype == np.uint16:
+        # Sensors often store 10 or 12 bit in 16 bit
+        if bits not in _LUTS:
+            _LUTS[bits] = (np.arange(2 ** 16) >> (bits - 8)).clip(0, 255).astype(np.uint8)
+        np.take(_LUTS[bits], frame, out=out, mode='clip')
+    elif np.issubdtype(frame.dtype, np.floating):
+        np.copyto(out, np.nan_to_num(np.clip(frame * 255, 0, 255)), casting='unsafe')
+    else:
+        np.copyto(out, np.clip(frame, 0, 255), casting='unsafe')
+
+
+def get_bit_depth(frame):
+    """ Guess significant bits of 16-bit frames, e.g. 10 or 12 bit sensors """
+    return min(max(int(frame.max()).bit_length(), 8), 16)
+
+
+# Overlay layers with the colors OpenCV's drawing functions used
+OVERLAY_COLORS = {
+    'marker_corners': QColor(0, 255, 0),
+    'square_corners': QColor(255, 0, 0),
+    'reprojected_corners': QColor(0, 0, 255),
+    'errors': QColor(255, 255, 0),
+}
+
+
+class ImageItem(QGraphicsItem):
+    """ Graphics item painting a QImage directly, so frames are never converted into a new QPixmap """
+
+    def __init__(self):
+        super().__init__()
+        self.image = None
+
+    def set_image(self, image):
+        if self.image is None or self.image.size() != image.size():
+            self.prepareGeometryChange()
+        self.image = image
+        self.update()
+
+    def boundingRect(self):
+        if self.image is None:
+            return QRectF()
+
+        return QRectF(0, 0, self.image.width(), self.image.height())
+
+    def paint(self, painter, option, widget=None):
+        if self.image is not None:
+            painter.drawImage(0, 0, self.image)
+
+
 class FrameWindow(QMainWindow):
+    BIT_DEPTHS = [8, 10, 12, 14, 16]
 
     def __init__(self, context, id_str: str):
         # Initialize widget
@@ -39,8 +103,21 @@ class FrameWindow(QMainWindow):
         self.action_scale = self.toolbar.addAction("Autoscale", self.on_toggle_scale)
         self.action_scale.setIcon(self.style().standardIcon(QStyle.SP_TitleBarMaxButton))
 
+        self.action_overlay = self.toolbar.addAction("Overlay", self.on_toggle_overlay)
+        self.action_overlay.setCheckable(True)
+        self.action_overlay.setChecked(True)
+
         self.toolbar.addAction("Save", self.on_save)
 
+        # Significant bits of 16-bit frames, guessed from the first frame and fixed afterwards
+        self.box_bit_depth = QComboBox()
+        for bits in self.BIT_DEPTHS:
+            self.box_bit_depth.addItem(f"{bits} bit", bits)
+        self.box_bit_depth.setToolTip("Bit depth of 16-bit frames")
+        self.box_bit_depth.setEnabled(False)
+        self.box_bit_depth.currentIndexChanged.connect(self.on_bit_depth_change)
+        self.toolbar.addWidget(self.box_bit_depth)
+
         self.addToolBar(Qt.TopToolBarArea, self.toolbar)
 
         # Initialize MDI Subwindow (if docked)
@@ -52,39 +129,135 @@ class FrameWindow(QMainWindow):
         # Member variables
         self.frame = None
         self.image = None
-        self.pixmap = None
         self.zoom = 0
+        self.frame_level = 0  # Frame is downscaled by 2 ** frame_level
+        self.bit_depth = None
+
+        self.overlay = {}
+
+        self._display_frame = None
+        self._display_buffer = None
 
         self._scene = QGraphicsScene(self.viewer)
-        self._pxi = QGraphicsPixmapItem()
-        self._scene.addItem(self._pxi)
+        self._image_item = ImageItem()
+        self._scene.addItem(self._image_item)
         self.viewer.setScene(self._scene)
         # TODO: change to pyqtgraph
 
-    def update_frame(self):
-        """ Load frame from context and display it """
-        self.frame = self.context.get_frame(self.id)
+        # Overlays are drawn on top of the frame, which itself is never modified
+        self._overlay_items = {}
+        for name, color in OVERLAY_COLORS.items():
+            pen = QPen(color)
+            pen.setCosmetic(True)
+
+            # Overlays are in full resolution frame coordinates, independent of the displayed resolution
+            item = QGraphicsPathItem()
+            item.setPen(pen)
+            item.setZValue(1)
+            # Pixel centers are at integer coordinates in OpenCV, but at half coordinates in Qt
+            item.setPos(0.5, 0.5)
+            self._scene.addItem(item)
+            self._overlay_items[name] = item
 
-        if self.frame is not None:
-            bytes_per_line = self.frame.nbytes // self.frame.shape[0]
-
-            # 'Detect' image format
-            format = QImage.Format_Indexed8
-            if self.frame.ndim > 2 and self.frame.shape[2] > 1:
-                format = QImage.Format_RGB888
+    def update_frame(self):
+        """ Load frame and overlay from context and display them """
+        self.set_frame(self.context.get_frame(self.id, scale=self.get_display_scale()),
+                       self.context.get_overlay(self.id))
 
-            # 'Convert' image to displayable pixmap
-            self.image = QImage(self.frame.data, self.frame.shape[1], self.frame.shape[0], bytes_per_line, format)
-            self.pixmap = QPixmap.fromImage(self.image)
+    def get_display_scale(self):
+        """ Return display pixels per full resolution frame pixel """
+        return self.viewer.transform().m11() * self.viewer.devicePixelRatioF()
 
-            self.update_pixmap()
+    def set_frame(self, frame, overlay=None):
+        """ Display supplied frame and overlay """
+        self.set_overlay(overlay if overlay is not None else {})
+        self.frame = frame
 
-    def update_pixmap(self, resize=False):
-        if self.pixmap:
-            self._pxi.setPixmap(self.pixmap)
+        if self.frame is not None:
+            # Painted from the reused buffer or the frame itself, without an intermediate pixmap
+            self.image = self.get_display_image(self.frame)
+
+            # Stretch downscaled frames to full resolution scene coordinates
+            width, height = self.context.get_frame_size(self.id) or (frame.shape[1], frame.shape[0])
+            self._image_item.setTransform(QtGui.QTransform.fromScale(width / frame.shape[1], height / frame.shape[0]))
+            self.frame_level = int(round(math.log2(width / frame.shape[1])))
+
+            self.update_image()
+
+    def get_display_image(self, frame):
+        """ Return QImage of frame, wrapping the frame's memory if it is C-contiguous 8-bit data """
+        if frame.ndim > 2 and frame.shape[2] == 1:
+            frame = frame[:, :, 0]
+
+        # Everything else is converted into a buffer that is reused for following frames
+        if frame.dtype != np.uint8 or not frame.flags.c_contiguous:
+            if self._display_buffer is None or self._display_buffer.shape != frame.shape:
+                self._display_buffer = np.empty(frame.shape, dtype=np.uint8)
+
+            if frame.dtype == np.uint16 and self.bit_depth is None:
+                self.set_bit_depth(get_bit_depth(frame))
+
+            to_uint8(frame, out=self._display_buffer, bits=self.bit_depth or 16)
+            frame = self._display_buffer
+
+        # 'Detect' image format
+        format = QImage.Format_Grayscale8
+        if frame.ndim > 2:
+            format = QImage.Format_RGBA8888 if frame.shape[2] == 4 else QImage.Format_RGB888
+
+        # QImage does not keep the memory alive, so keep a reference to it
+        self._display_frame = frame
+        return QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], format)
+
+    def set_bit_depth(self, bits):
+        """ Set significant bits of 16-bit frames, rounded up to a supported depth """
+        self.bit_depth = next(depth for depth in self.BIT_DEPTHS if depth >= bits)
+
+        self.box_bit_depth.blockSignals(True)
+        self.box_bit_depth.setCurrentIndex(self.BIT_DEPTHS.index(self.bit_depth))
+        self.box_bit_depth.setEnabled(True)
+        self.box_bit_depth.blockSignals(False)
+
+    def set_overlay(self, overlay):
+        """ Display overlay vector data, see CalibrationContext.get_overlay """
+        self.overlay = overlay
+
+        for name, item in self._overlay_items.items():
+            item.setPath(self.get_overlay_path(name, overlay.get(name, None)))
+
+    @staticmethod
+    def get_overlay_path(name, data):
+        path = QPainterPath()
+
+        if data is None:
+            return path
+
+        if name == 'marker_corners':
+            for polygon in data:
+                path.addPolygon(QPolygonF([QPointF(x, y) for x, y in polygon]))
+                path.closeSubpath()
+        elif name == 'square_corners':
+            for x, y in data:
+                path.addRect(x - 3, y - 3, 6, 6)
+        elif name == 'reprojected_corners':
+            for x, y in data:
+                path.moveTo(x - 10, y)
+                path.lineTo(x + 10, y)
+                path.moveTo(x, y - 10)
+                path.lineTo(x, y + 10)
+        elif name == 'errors':
+            for (x0, y0), (x1, y1) in data:
+                path.moveTo(x0, y0)
+                path.lineTo(x1, y1)
+
+        return path
+
+    def update_image(self, resize=False):
+        if self.image is not None:
+            self._image_item.set_image(self.image)
 
             if resize:
-                rect = QtCore.QRectF(self._pxi.pixmap().rect())
+                rect = self._image_item.sceneBoundingRect()
                 self.viewer.setSceneRect(rect)
                 view_rect = self.viewer.viewport().rect()
                 scene_rect = self.viewer.transform().mapRect(rect)
@@ -92,6 +265,13 @@ class FrameWindow(QMainWindow):
                 factor = min(view_rect.width() / scene_rect.width(),
                              view_rect.height() / scene_rect.height())
                 self.viewer.scale(factor, factor)
+                self.on_view_scale_change()
+
+    def on_view_scale_change(self):
+        """ Reload frame if the view needs a different resolution """
+        if self.frame is not None and \
+                self.context.get_pyramid_level(self.get_display_scale()) != self.frame_level:
+            self.update_frame()
 
     # Qt overrides
 
@@ -109,7 +289,7 @@ class FrameWindow(QMainWindow):
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
-        self.update_pixmap()
+        self.update_image()
 
     # Toolbar callbacks
 
@@ -125,14 +305,32 @@ class FrameWindow(QMainWindow):
             self.subwindow.show()
 
     def on_toggle_scale(self):
-        self.update_pixmap(resize=True)
+        self.update_image(resize=True)
+
+    def on_bit_depth_change(self):
+        self.bit_depth = self.box_bit_depth.currentData()
+        self.set_frame(self.frame, self.overlay)
+
+    def on_toggle_overlay(self):
+        for item in self._overlay_items.values():
+            item.setVisible(self.action_overlay.isChecked())
 
     def on_save(self):
         file = QFileDialog.getSaveFileName(self, "Save Frame", "", "PNG Image (*.png)")[0]
 
-        if file:
+        if file and self.image is not None:
             file += '.png' if not file.endswith('.png') else ''
-            imageio.imwrite(file, np.squeeze(self.frame))
+
+            # Render frame with visible overlays at full frame resolution
+            self.set_frame(self.context.get_frame(self.id), self.overlay)
+            rect = self._image_item.sceneBoundingRect()
+            image = QImage(rect.size().toSize(), QImage.Format_RGB888)
+            painter = QPainter(image)
+            self._scene.render(painter, QtCore.QRectF(image.rect()), rect)
+            painter.end()
+            image.save(file)
+
+            self.update_frame()
 
 
 class Viewer(QGraphicsView):
@@ -154,6 +352,8 @@ class Viewer(QGraphicsView):
 
         if self.parent().zoom > 0:
             self.scale(factor, factor)
+            # Zooming in may need a higher resolution
+            self.parent().on_view_scale_change()
         else:
-            self.parent().update_pixmap(resize=True)
+            self.parent().update_image(resize=True)
             self.parent().zoom = 0
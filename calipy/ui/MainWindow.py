@@ -6,6 +6,7 @@ import logging
 import numpy as np
 import yaml
 from PyQt5.Qt import Qt, QIcon
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import QMainWindow, QMdiArea, QFileDialog, QMessageBox
 from calibcamlib import Camerasystem as cs
 
@@ -15,6 +16,8 @@ logger = logging.getLogger(__name__)
 
 
 class MainWindow(QMainWindow):
+    # Emitted from worker threads, delivered in the GUI thread
+    frames_ready = pyqtSignal(int, int, object)
 
     def __init__(self, context):
         self.context = context
@@ -25,6 +28,8 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(self.mdi)
         self.subwindows = {}
 
+        self.frames_ready.connect(self.on_frames_ready)
+
         # Setup menu bar
         session_menu = self.menuBar().addMenu("&File")
         session_menu.addAction(QIcon.fromTheme("document-open"), "&Open...", self.on_system_open)
@@ -41,7 +46,7 @@ class MainWindow(QMainWindow):
         result_menu = self.menuBar().addMenu("&Result")
         result_menu.addAction("&Load Calib", self.on_load_calib)
         result_menu.addSeparator()
-        result_menu.addAction("&Plot system calib. errors", self.context.plot_system_calibration_errors)
+        result_menu.addAction("&Plot system calib. errors", lambda: self.context.plot_system_calibration_errors())
 
         help_menu = self.menuBar().addMenu("&Help")
         help_menu.addAction("&About", self.on_about)
@@ -58,6 +63,7 @@ class MainWindow(QMainWindow):
 
         self.dock_time = ui.TimelineDock(context)
         self.dock_time.time_index_changed.connect(self.on_timeline_change)
+        self.dock_time.time_index_scrubbed.connect(self.on_timeline_scrub)
         self.dock_time.subset_changed.connect(self.on_timeline_change)
         self.addDockWidget(Qt.BottomDockWidgetArea, self.dock_time)
 
@@ -73,7 +79,7 @@ class MainWindow(QMainWindow):
         """Open specified system file in UI"""
 
         if file.endswith(".system.yml"):
-            self.context.load(file)
+            self.context.load(file, progress=self.on_open_progress)
         else:
             logger.log(logging.WARNING, f"{file}: unrecognised file!")
 
@@ -85,14 +91,13 @@ class MainWindow(QMainWindow):
         self.sync_subwindows_cameras()
         self.sync_subwindows_sources()
 
+    def on_open_progress(self, count, total):
+        self.statusBar().showMessage(f"Opened {count} of {total} recordings", 3000)
+        # Paint right away, the event loop only resumes once all recordings are open
+        self.statusBar().repaint()
+
     def open_videos(self, videos, pipelines=None):
-        self.context.add_session()
-        for i, rec in enumerate(videos):
-            self.context.add_camera(str(i))
-            pipeline = None
-            if pipelines is not None:
-                pipeline = pipelines[i] if len(pipelines[i]) else None
-            self.context.add_recording(str(i), rec, pipeline=pipeline)
+        self.context.open_videos(videos, pipelines=pipelines)
 
         self.dock_cameras.update_cameras()
         self.dock_sessions.update_sources()
@@ -107,8 +112,21 @@ class MainWindow(QMainWindow):
         self.sync_subwindows_cameras()
 
     def on_timeline_change(self):
+        # Calibration results of the frame are updated together with the frames, see on_frames_ready
         self.update_subwindows()
-        self.dock_calibration.update_result()
+
+    def on_timeline_scrub(self):
+        """ Show closest already decoded frames while the timeline slider is dragged """
+        if self.context.session is None:
+            return
+
+        # Previews must not be overwritten by frames requested before
+        self.context.cancel_frame_requests()
+
+        for id, sub in self.subwindows.items():
+            frame = self.context.get_preview_frame(id)
+            if frame is not None:
+                sub.set_frame(frame)
 
     def on_calib_model_change(self):
         self.update_timeline_dock()
@@ -146,7 +164,7 @@ class MainWindow(QMainWindow):
 
         # Display windows based on available sources
         for id, win in self.subwindows.items():
-            if self.context.get_frame(id) is None:
+            if not self.context.has_reader(id):
                 win.hide()
             else:
                 win.show()
@@ -160,12 +178,24 @@ class MainWindow(QMainWindow):
         self.dock_calibration.update_result()
 
     def update_subwindows(self):
-        """ Update current frame on all subwindows """
+        """ Request current frame for all subwindows, which are updated once the frames are decoded """
         if self.context.session is None:
             return
 
-        for sub in self.subwindows.values():
-            sub.update_frame()
+        # Decode all cameras concurrently in the background, at the resolution they are displayed at
+        scales = {id: sub.get_display_scale() for id, sub in self.subwindows.items()}
+        self.context.request_frames(list(self.subwindows.keys()), self.frames_ready.emit, scales=scales)
+
+    def on_frames_ready(self, request_id, index, frames):
+        """ Display decoded frames, unless the user already moved on """
+        if not self.context.is_current_request(request_id):
+            return
+
+        for id, frame in frames.items():
+            if id in self.subwindows:
+                self.subwindows[id].set_frame(frame, self.context.get_overlay(id, index))
+
+        self.dock_calibration.update_result()
 
     def update_subwindow(self, id):
         """ Update current frame on specific subwindow """
@@ -5,13 +5,16 @@ import datetime
 from math import isinf
 
 from PyQt5.Qt import Qt
-from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtWidgets import QDockWidget, QWidget, QHBoxLayout, QVBoxLayout
-from PyQt5.QtWidgets import QSlider, QComboBox, QSpinBox, QLabel
+from PyQt5.QtCore import pyqtSignal, QTimer, QElapsedTimer
+from PyQt5.QtWidgets import QDockWidget, QWidget, QHBoxLayout, QVBoxLayout, QStyle
+from PyQt5.QtWidgets import QSlider, QComboBox, QSpinBox, QLabel, QToolButton
 
 
 class TimelineDock(QDockWidget):
+    PLAYBACK_RATES = [0.1, 0.25, 0.5, 1, 2, 4]
+
     time_index_changed = pyqtSignal()
+    time_index_scrubbed = pyqtSignal()  # Index changed while slider is dragged
     subset_changed = pyqtSignal()
 
     def __init__(self, context):
@@ -28,8 +31,39 @@ class TimelineDock(QDockWidget):
         self.slider = QSlider(Qt.Horizontal, self)
         self.slider.setTickPosition(QSlider.TicksBothSides)
         self.slider.setRange(0, 0)
-        self.slider.setTracking(False)
+        self.slider.setTracking(True)
         self.slider.valueChanged.connect(self.on_index_change)
+        self.slider.sliderReleased.connect(self.on_slider_settle)
+
+        # Exact frames are shown once the slider rests for a moment or is released
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(150)
+        self.settle_timer.timeout.connect(self.on_slider_settle)
+
+        # Init playback controls
+        self.button_play = QToolButton()
+        self.button_play.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
+        self.button_play.setCheckable(True)
+        self.button_play.toggled.connect(self.on_play_toggle)
+        self.slider.sliderPressed.connect(self.stop_playback)
+
+        self.box_rate = QComboBox()
+        for rate in self.PLAYBACK_RATES:
+            self.box_rate.addItem(f"{rate:g}x", rate)
+        self.box_rate.setCurrentIndex(self.PLAYBACK_RATES.index(1))
+        self.box_rate.currentIndexChanged.connect(self.on_rate_change)
+
+        self.label_fps = QLabel("")
+
+        self.play_timer = QTimer(self)
+        self.play_timer.setTimerType(Qt.PreciseTimer)
+        self.play_timer.timeout.connect(self.on_play_tick)
+        self.play_clock = QElapsedTimer()
+        self._play_start = 0  # Slider value at start of playback
+        self._play_read_ahead = None  # Read-ahead before playback
+        self._fps_clock = QElapsedTimer()
+        self._fps_frames = 0
 
         # Init label
         self.label_left = QLabel("0")
@@ -54,6 +88,9 @@ class TimelineDock(QDockWidget):
         label_layout = QHBoxLayout()
         label_layout.addWidget(self.label_left)
         label_layout.addStretch()
+        label_layout.addWidget(self.button_play)
+        label_layout.addWidget(self.box_rate)
+        label_layout.addWidget(self.label_fps)
         label_layout.addWidget(self.box_subset)
         label_layout.addWidget(self.box_current)
         label_layout.addWidget(self.label_current)
@@ -125,8 +162,17 @@ class TimelineDock(QDockWidget):
 
             self.context.set_current_frame(value)
 
-            # Update frame views
-            self.time_index_changed.emit()
+            # Update frame views, with previews while dragging
+            if self.slider.isSliderDown():
+                self.settle_timer.start()
+                self.time_index_scrubbed.emit()
+            else:
+                self.settle_timer.stop()
+                self.time_index_changed.emit()
+
+    def on_slider_settle(self):
+        self.settle_timer.stop()
+        self.time_index_changed.emit()
 
     def on_subset_change(self, value):
         # Ignore empty selection
@@ -136,6 +182,7 @@ class TimelineDock(QDockWidget):
         if not self._updating_dock:
             sub_id = self.box_subset.currentText()
             self.current_subset = self.subsets[sub_id]
+            self.context.set_subset(self.current_subset)
 
             # Map indices between subsets
             if self.current_subset is not None:
@@ -150,3 +197,72 @@ class TimelineDock(QDockWidget):
 
             self.update_slider()
             self.subset_changed.emit()
+
+    # Playback
+
+    def get_playback_fps(self):
+        return self.context.get_fps() * self.box_rate.currentData()
+
+    def start_playback(self):
+        fps = self.get_playback_fps()
+        if not fps or self.slider.value() >= self.slider.maximum():
+            self.button_play.setChecked(False)
+            return
+
+        # Read up to a second ahead (within the frame cache budget), so readers decode sequentially
+        self._play_read_ahead = self.context.get_read_ahead()
+        self.context.set_read_ahead(max(self._play_read_ahead, int(fps)))
+
+        self.restart_play_clock()
+        self.play_timer.start(max(int(1000 / fps), 1))
+
+    def restart_play_clock(self):
+        self._play_start = self.slider.value()
+        self.play_clock.start()
+        self._fps_clock.start()
+        self._fps_frames = 0
+
+    def stop_playback(self):
+        self.button_play.setChecked(False)
+
+    def on_play_tick(self):
+        # Drop frames while the frames of the previous step are still being decoded
+        if self.context.is_request_pending():
+            return
+
+        # Advance by wall time, so slow decoding skips frames instead of slowing down playback
+        value = self._play_start + int(self.play_clock.elapsed() / 1000 * self.get_playback_fps())
+        if value > self.slider.maximum():
+            self.slider.setValue(self.slider.maximum())
+            self.stop_playback()
+            return
+
+        if value != self.slider.value():
+            self.slider.setValue(value)
+            self._fps_frames += 1
+
+        # Report achieved frame rate about once a second
+        if self._fps_clock.elapsed() >= 1000:
+            self.label_fps.setText(f"{self._fps_frames / self._fps_clock.elapsed() * 1000:.1f} fps")
+            self._fps_clock.start()
+            self._fps_frames = 0
+
+    # Playback callbacks
+
+    def on_play_toggle(self, checked):
+        if checked:
+            self.button_play.setIcon(self.style().standardIcon(QStyle.SP_MediaPause))
+            self.start_playback()
+        else:
+            self.button_play.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
+            self.play_timer.stop()
+            self.label_fps.setText("")
+
+            if self._play_read_ahead is not None:
+                self.context.set_read_ahead(self._play_read_ahead)
+                self._play_read_ahead = None
+
+    def on_rate_change(self):
+        if self.play_timer.isActive():
+            self.restart_play_clock()
+            self.play_timer.setInterval(max(int(1000 / self.get_playback_fps()), 1))
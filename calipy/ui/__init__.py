@@ -1,10 +1,15 @@
 # (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
 # SPDX-License-Identifier: LGPL-2.1
 
-from .CalibrationDock import CalibrationDock
-from .CamerasDock import CamerasDock
-from .DetectionDock import DetectionDock
-from .FrameWindow import FrameWindow
-from .MainWindow import MainWindow
-from .SourcesDock import SourcesDock
-from .TimelineDock import TimelineDock
+from calipy.lazy import lazy_exports
+
+# Imported on first access, see calipy.lazy
+lazy_exports(__name__, {
+    'CalibrationDock': 'CalibrationDock',
+    'CamerasDock': 'CamerasDock',
+    'DetectionDock': 'DetectionDock',
+    'FrameWindow': 'FrameWindow',
+    'MainWindow': 'MainWindow',
+    'SourcesDock': 'SourcesDock',
+    'TimelineDock': 'TimelineDock',
+})
@@ -26,6 +26,7 @@ class PyInstallerCommand(cmd.Command):
 setup(
     entry_points={
         "gui_scripts": ["calipy = calipy.main:main"],
+        "console_scripts": ["calipy-report = calipy.report:main"],
     },
     cmdclass={
         "standalone": PyInstallerCommand,
@@ -0,0 +1,26 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("yaml")
+
+from calipy.metaio import cache_dir  # noqa: E402
+
+
+@pytest.mark.parametrize("system_path, expected", [
+    ("/data/rig.system.yml", "/data/rig.cache"),
+    ("/data/rig.a.system.yml", "/data/rig.a.cache"),
+    ("/data/rig.b.system.yml", "/data/rig.b.cache"),
+    ("/data/rig.yml", "/data/rig.cache"),
+])
+def test_cache_dir_next_to_system_file(system_path, expected):
+    assert cache_dir(system_path) == Path(expected)
+
+
+def test_cache_dir_without_system_file(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    assert cache_dir() == tmp_path / "calipy"
@@ -0,0 +1,36 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("yaml")
+
+from calipy.detect.DetectionStore import DetectionStore, LazyDetections  # noqa: E402
+
+
+def detection(n):
+    return {'square_ids': np.arange(n), 'square_corners': np.full((n, 1, 2), float(n))}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DetectionStore.for_source(tmp_path / "user", "charuco", "abc")
+    store.append({0: detection(4), 1: None})
+    store.append({2: detection(6)})
+    return store
+
+
+@pytest.mark.parametrize("copy", [False, True])
+def test_move_to(tmp_path, store, copy):
+    old_path = store.path
+    target = DetectionStore.for_source(tmp_path / "rig.cache", "charuco", "abc")
+    target.append({5: detection(1)})
+
+    detections = LazyDetections(store)
+    store.move_to(target.path, copy=copy)
+
+    assert store.path == target.path
+    assert store.get_processed_frames() == {0, 1, 2}
+    assert list(detections) == [0, 2]
+    assert DetectionStore(old_path).exists() == copy
@@ -0,0 +1,103 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+""" Frames per second of displaying decoded frames in a FrameWindow, rendered offscreen """
+
+import os
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PyQt5")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from calipy.ui.FrameWindow import FrameWindow, to_uint8, get_bit_depth  # noqa: E402
+
+WIDTH, HEIGHT = 2048, 1536
+# Far below what a single camera needs for playback, so only regressions fail
+MIN_FPS = 30
+
+
+class FrameContext:
+    """ Context serving full resolution frames without overlay """
+
+    def get_frame_size(self, id):
+        return WIDTH, HEIGHT
+
+    def get_frame(self, id, index=None, scale=1.0):
+        return None
+
+    def get_overlay(self, id, index=None):
+        return {}
+
+    @staticmethod
+    def get_pyramid_level(scale):
+        return 0
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def window(app):
+    window = FrameWindow(FrameContext(), "0")
+    window.resize(1024, 768)
+    window.show()
+    app.processEvents()
+
+    yield window
+    window.hide()
+
+
+def make_frames(dtype, channels, count=5):
+    rng = np.random.default_rng(0)
+    shape = (HEIGHT, WIDTH, channels) if channels > 1 else (HEIGHT, WIDTH)
+    return [rng.integers(0, 4096 if dtype == np.uint16 else 256, shape, dtype=dtype) for _ in range(count)]
+
+
+def test_to_uint8_ignores_frame_content():
+    frame = np.array([[0, 1023, 4095]], dtype=np.uint16)
+    out = np.empty(frame.shape, dtype=np.uint8)
+
+    to_uint8(frame, out, bits=12)
+    assert out.tolist() == [[0, 63, 255]]
+
+    # A darker frame keeps the brightness of the same values
+    to_uint8(frame[:, :2], out[:, :2], bits=12)
+    assert out[0, 1] == 63
+
+    assert get_bit_depth(frame) == 12
+
+
+def test_bit_depth_is_kept(window):
+    frames = make_frames(np.uint16, 1, count=1)
+    window.set_frame(frames[0])
+    assert window.bit_depth == 12
+
+    # A dark frame does not change the mapping
+    window.set_frame(frames[0] >> 4)
+    assert window.bit_depth == 12
+    assert (window.image.width(), window.image.height()) == (WIDTH, HEIGHT)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("dtype, channels", [(np.uint8, 3), (np.uint8, 1), (np.uint16, 1), (np.uint16, 3)])
+def test_display_frames_per_second(app, window, dtype, channels):
+    frames = make_frames(dtype, channels) * 4
+
+    def display(frame):
+        window.set_frame(frame)
+        window.viewer.viewport().repaint()
+
+    display(frames[0])
+
+    start = time.perf_counter()
+    for frame in frames:
+        display(frame)
+    fps = len(frames) / (time.perf_counter() - start)
+
+    assert fps > MIN_FPS
@@ -0,0 +1,46 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+yaml = pytest.importorskip("yaml")
+
+from calipy.metaio import FingerprintCache  # noqa: E402
+
+
+@pytest.fixture
+def files(tmp_path):
+    urls = []
+    for i in range(2):
+        url = tmp_path / f"video_{i}.mp4"
+        url.write_bytes(os.urandom(1024))
+        urls.append(str(url))
+
+    return urls
+
+
+def test_concurrent_caches_keep_all_entries(tmp_path, files):
+    # Like two report processes sharing the default cache
+    path = tmp_path / "cache" / "fingerprints.yml"
+    cache_a, cache_b = FingerprintCache(path), FingerprintCache(path)
+
+    hash_a = cache_a.get(files[0])
+    hash_b = cache_b.get(files[1])
+
+    with open(path) as file:
+        entries = yaml.safe_load(file)
+
+    assert {entry['hash'] for entry in entries.values()} == {hash_a, hash_b}
+    assert [p.name for p in path.parent.iterdir()] == [path.name]
+
+
+def test_cached_fingerprint_is_reused(tmp_path, files):
+    path = tmp_path / "fingerprints.yml"
+    hash = FingerprintCache(path).get(files[0])
+    mtime = path.stat().st_mtime_ns
+
+    assert FingerprintCache(path).get(files[0]) == hash
+    assert path.stat().st_mtime_ns == mtime
@@ -0,0 +1,65 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import threading
+import time
+
+from calipy.core.FrameCache import FrameCache
+from calipy.core.FramePrefetcher import FramePrefetcher
+
+
+class Frame:
+    nbytes = 1024
+
+
+class SlowReader:
+    """ Reader that fails if used after being closed """
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.closed = False
+        self.used_closed = False
+        self.reads = 0
+
+    def get_data(self, index):
+        if self.closed:
+            self.used_closed = True
+        time.sleep(self.delay)
+        self.reads += 1
+        return Frame()
+
+    def close(self):
+        self.closed = True
+
+
+def test_replaced_worker_stops_before_reader_is_closed():
+    prefetcher = FramePrefetcher(FrameCache(), ahead=20)
+    reader = SlowReader()
+    prefetcher.set_readers({'0': reader}, {'0': 'src'})
+    prefetcher.get_frame('0', 0)
+    worker = prefetcher._workers['0']
+
+    prefetcher.set_readers({}, {})
+    assert not worker.is_alive()
+    reader.close()
+    time.sleep(0.05)
+
+    assert not reader.used_closed
+    assert reader.reads < 21
+
+
+def test_close_waits_for_synchronous_reads():
+    prefetcher = FramePrefetcher(FrameCache())
+    reader = SlowReader(delay=0.1)
+    prefetcher.set_readers({'0': reader}, {'0': 'src'})
+
+    thread = threading.Thread(target=prefetcher.get_frame, args=('0', 5))
+    thread.start()
+    time.sleep(0.02)
+
+    prefetcher.close()
+    assert reader.reads >= 1
+    reader.close()
+
+    thread.join()
+    assert not reader.used_closed
@@ -0,0 +1,76 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import os
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("yaml")
+
+from calipy.core import BaseContext  # noqa: E402
+
+
+class ArrayReader:
+    """ Reader of frames filled with their index """
+
+    def __init__(self, value):
+        self.value = value
+        self.closed = False
+
+    def get_data(self, index):
+        return np.full((4, 6), self.value * 100 + index, dtype=np.uint16)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def context(tmp_path):
+    videos = []
+    for i in range(2):
+        url = tmp_path / f"cam_{i}.mp4"
+        url.write_bytes(os.urandom(1024))
+        videos.append(str(url))
+
+    context = BaseContext(open_readers=False)
+    context.open_videos(videos)
+
+    # Readers of already probed recordings
+    for i, (id, rec) in enumerate(context.session.recordings.items()):
+        rec.offset = (0, 0)
+        rec.n_frames = 10
+        context.vid_readers[id] = ArrayReader(i)
+    context._readers_changed()
+
+    yield context
+    context.close()
+
+
+def test_get_frames(context):
+    frames = context.get_frames(['0', '1'], 3)
+
+    assert {id: int(frame[0, 0]) for id, frame in frames.items()} == {'0': 3, '1': 103}
+    assert context.get_frame_size('0') == (6, 4)
+
+
+def test_request_frames(context):
+    delivered = threading.Event()
+    results = []
+
+    def callback(request_id, index, frames):
+        results.append((request_id, index, {id: int(frame[0, 0]) for id, frame in frames.items()}))
+        delivered.set()
+
+    request_id = context.request_frames(['0', '1'], callback, index=5)
+
+    assert delivered.wait(5)
+    assert results == [(request_id, 5, {'0': 5, '1': 105})]
+
+
+def test_close_closes_readers(context):
+    readers = list(context.vid_readers.values())
+    context.close()
+
+    assert all(reader.closed for reader in readers)
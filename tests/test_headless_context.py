@@ -0,0 +1,71 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+""" Contexts without readers, as used by calipy-report """
+
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("yaml")
+
+from calipy.core import BaseContext  # noqa: E402
+
+
+@pytest.fixture
+def videos(tmp_path):
+    # Never decoded, so any content will do
+    urls = []
+    for i in range(3):
+        url = tmp_path / f"cam_{i}" / "video.mp4"
+        url.parent.mkdir()
+        url.write_bytes(os.urandom(4096))
+        urls.append(str(url))
+
+    return urls
+
+
+def test_open_videos_without_readers(videos):
+    threads = threading.active_count()
+
+    context = BaseContext(open_readers=False)
+    context.open_videos(videos)
+
+    assert context.vid_readers == {}
+    assert list(context.source_ids) == ['0', '1', '2']
+    assert len(set(context.source_ids.values())) == 3
+    assert context.get_length() == 0
+    assert threading.active_count() == threads
+
+    context.close()
+
+
+def test_load_without_readers(tmp_path, videos):
+    context = BaseContext(open_readers=False)
+    context.open_videos(videos)
+    context.save(tmp_path / "test.system.yml")
+    source_ids = context.source_ids
+    context.close()
+
+    context = BaseContext(open_readers=False)
+    context.load(tmp_path / "test.system.yml")
+
+    assert context.vid_readers == {}
+    assert context.source_ids == source_ids
+
+    context.clear()
+    assert not context.open_readers
+
+
+def test_sensor_offset_without_readers(videos):
+    context = BaseContext(open_readers=False)
+    context.open_videos(videos)
+
+    # Known from the system file, so no reader is needed
+    context.session.recordings['1'].offset = (8, 4)
+
+    assert context.get_sensor_offset('1') == (8, 4)
+    assert context.get_sensor_offset('unknown') is None
+
+    context.close()
@@ -0,0 +1,62 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+""" Startup cost of the headless and GUI import paths, each measured in a fresh interpreter
+
+Heavy modules staying unloaded guards against regressions. Import times depend on the machine, so they are only
+checked with --benchmark, with limits multiplied by CALIPY_IMPORT_TIME_SCALE for slow machines.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+GUI_MODULES = ['PyQt5', 'pyqtgraph', 'cv2', 'matplotlib']
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}}))
+"""
+
+# statement > (required modules, modules that must not be loaded, seconds)
+PATHS = {
+    "import calipy.metaio": (['numpy', 'yaml'], GUI_MODULES, 1.0),
+    "import calipy.core": ([], GUI_MODULES + ['numpy'], 0.5),
+    "from calipy.core import CalibrationContext": (['numpy', 'yaml', 'calibcamlib'],
+                                                   ['PyQt5', 'pyqtgraph', 'matplotlib'], 3.0),
+    "import calipy.report": (['numpy', 'yaml', 'calibcamlib'], ['PyQt5', 'pyqtgraph', 'matplotlib'], 3.0),
+    "from calipy.main import main": (['PyQt5', 'pyqtgraph', 'cv2', 'calibcamlib'], [], 5.0),
+}
+
+
+def import_in_subprocess(statement):
+    result = subprocess.run([sys.executable, "-c", CHILD.format(statement=statement)],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def import_path(statement):
+    required, _, _ = PATHS[statement]
+    for name in required:
+        pytest.importorskip(name)
+
+    return import_in_subprocess(statement)
+
+
+@pytest.mark.parametrize("statement", [s for s, (_, unloaded, _) in PATHS.items() if unloaded])
+def test_heavy_modules_not_loaded(statement):
+    result = import_path(statement)
+
+    assert [name for name in PATHS[statement][1] if name in result['modules']] == []
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("statement", list(PATHS))
+def test_import_time(statement):
+    result = import_path(statement)
+
+    assert result['seconds'] < PATHS[statement][2] * float(os.environ.get('CALIPY_IMPORT_TIME_SCALE', 1.0))
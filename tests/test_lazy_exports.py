@@ -0,0 +1,50 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+""" Package exports stay bound to their classes however the submodules are imported, see calipy.lazy """
+
+import subprocess
+import sys
+
+import pytest
+
+
+def run(code):
+    # Fresh interpreter, as submodules imported by other tests would hide the import order
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+@pytest.mark.parametrize("code", [
+    # Submodule imported directly first
+    "from calipy.core.FrameCache import FrameCache as A\n"
+    "from calipy.core import FrameCache\n"
+    "assert FrameCache is A",
+    "import calipy.core.LazyMap\n"
+    "from calipy.core import LazyMap\n"
+    "assert isinstance(LazyMap, type) and LazyMap(keys=[]) is not None",
+    # Export accessed first
+    "from calipy.core import FramePrefetcher\n"
+    "import calipy.core.FramePrefetcher\n"
+    "import calipy.core\n"
+    "assert calipy.core.FramePrefetcher is FramePrefetcher and isinstance(FramePrefetcher, type)",
+    # Subpackages
+    "import calipy\n"
+    "assert calipy.core.__name__ == 'calipy.core' and 'FrameCache' in dir(calipy.core)",
+])
+def test_exports_are_classes(code):
+    run(code)
+
+
+def test_context_after_submodule_import():
+    pytest.importorskip("numpy")
+    pytest.importorskip("yaml")
+
+    run("import calipy.core.BaseContext\n"
+        "from calipy.core import BaseContext\n"
+        "BaseContext(open_readers=False).close()")
+
+
+def test_unknown_attribute():
+    import calipy.core
+
+    with pytest.raises(AttributeError):
+        calipy.core.Unknown
@@ -0,0 +1,131 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+""" CalibrationContext.load_calibration on a synthetic calibcam result, against the former per-frame loop """
+
+import os
+import time
+import warnings
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("yaml")
+pytest.importorskip("cv2")
+pytest.importorskip("scipy")
+pytest.importorskip("calibcamlib")
+
+from calipy.core import CalibrationContext  # noqa: E402
+
+N_CAMS, N_FRAMES, N_CORNERS = 4, 5000, 24
+
+
+@pytest.fixture(scope="module")
+def calib_dict(tmp_path_factory):
+    """ Synthetic calibcam result, with undetected corners and frames as NaN """
+    rng = np.random.default_rng(0)
+
+    # Videos are only hashed, never decoded
+    videos = []
+    for i in range(N_CAMS):
+        url = tmp_path_factory.mktemp(f"cam_{i}") / "video.mp4"
+        url.write_bytes(os.urandom(1024))
+        videos.append(str(url))
+
+    corners = rng.uniform(0, 1000, (N_CAMS, N_FRAMES, N_CORNERS, 2))
+    corners[rng.random((N_CAMS, N_FRAMES, N_CORNERS)) < 0.3] = np.nan
+    corners[:, rng.random(N_FRAMES) < 0.1] = np.nan
+    fun_final = np.where(np.isnan(corners), np.nan, rng.normal(0, 0.5, corners.shape))
+
+    def calibration():
+        return {'A': np.array([[1000.0, 0, 500], [0, 1000, 500], [0, 0, 1]]),
+                'k': np.zeros(5),
+                'xi': np.zeros(1),
+                'rvec_cam': rng.normal(0, 0.1, 3),
+                'tvec_cam': rng.normal(0, 1, 3)}
+
+    calibs_single = []
+    for _ in range(N_CAMS):
+        calibs_single.append(dict(calibration(),
+                                  frames_mask=rng.random(N_FRAMES) < 0.8,
+                                  rvecs=rng.normal(size=(N_FRAMES, 3)),
+                                  tvecs=rng.normal(size=(N_FRAMES, 3)),
+                                  repro_error=0.5))
+
+    return {
+        'version': 'test',
+        'rec_file_names': videos,
+        'board_params': {'boardWidth': 5, 'boardHeight': 7, 'square_size_real': 1.0, 'marker_size_real': 0.6},
+        'calibs': [calibration() for _ in range(N_CAMS)],
+        'info': {
+            'opts': {},
+            'used_frames_ids': list(range(0, 3 * N_FRAMES, 3)),
+            'corners': corners,
+            'fun_final': fun_final.reshape(-1),
+            'rvecs_boards': rng.normal(size=(N_FRAMES, 3)),
+            'tvecs_boards': rng.normal(size=(N_FRAMES, 3)),
+            'other': {'calibs_single': calibs_single},
+        },
+    }
+
+
+def load(calib_dict):
+    context = CalibrationContext(open_readers=False)
+    context.open_videos(calib_dict['rec_file_names'])
+    context.load_calibration(calib_dict)
+
+    return context
+
+
+def per_frame_errors(calib_dict, cam_idx):
+    """ Former loader, three reductions per frame """
+    final_err = np.abs(np.asarray(calib_dict['info']['fun_final']).reshape(calib_dict['info']['corners'].shape))
+
+    errors = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for index, frm_idx in enumerate(calib_dict['info']['used_frames_ids']):
+            errors[frm_idx] = (np.nanmax(final_err[cam_idx, index]),
+                               np.nanmedian(final_err[cam_idx, index]),
+                               np.nanmean(final_err[cam_idx, index]))
+
+    return errors
+
+
+def test_load_calibration(calib_dict):
+    context = load(calib_dict)
+    expected = per_frame_errors(calib_dict, 1)
+
+    estimations = context.get_current_estimations_boards()[context.get_source_id('1')]
+    assert list(estimations) == list(expected)
+    for frm_idx in list(expected)[:50]:
+        np.testing.assert_allclose([estimations[frm_idx][key] for key in ['max_err', 'med_err', 'mean_err']],
+                                   expected[frm_idx])
+
+    stats = context.get_calibration_stats()
+    assert sorted(stats) == [str(i) for i in range(N_CAMS)]
+    assert stats['1']['single_estimations'] == int(np.count_nonzero(
+        calib_dict['info']['other']['calibs_single'][1]['frames_mask']))
+
+    context.close()
+
+
+@pytest.mark.benchmark
+def test_load_calibration_is_faster(calib_dict):
+    start = time.perf_counter()
+    for cam_idx in range(N_CAMS):
+        per_frame_errors(calib_dict, cam_idx)
+    per_frame_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    context = load(calib_dict)
+    load_time = time.perf_counter() - start
+
+    # Accessing all per-frame results computes the statistics in one batch per camera
+    start = time.perf_counter()
+    for estimations in context.get_current_estimations_boards().values():
+        dict(estimations.items())
+    access_time = time.perf_counter() - start
+    context.close()
+
+    assert load_time < per_frame_time / 3
+    assert load_time + access_time < per_frame_time
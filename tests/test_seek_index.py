@@ -0,0 +1,59 @@
+# (c) 2019 MPI for Neurobiology of Behavior, Florian Franzen, Abhilash Cheekoti
+# SPDX-License-Identifier: LGPL-2.1
+
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("yaml")
+
+from calipy.metaio import SeekIndex, IndexedReader  # noqa: E402
+
+
+class PlainReader:
+    def __init__(self):
+        self.closed = False
+
+    def get_data(self, index):
+        return np.full((2, 2), index)
+
+    def close(self):
+        self.closed = True
+
+
+def test_plain_reads_while_index_is_built():
+    started = threading.Event()
+    stopped = []
+
+    def build_index(stop):
+        started.set()
+        stop.wait(5)
+        stopped.append(stop.is_set())
+        return None
+
+    reader = IndexedReader(PlainReader(), "video.mp4", build_index=build_index)
+    assert started.wait(5)
+
+    # Frames are served without waiting for the index
+    assert int(reader.get_data(3)[0, 0]) == 3
+    assert not reader.is_indexed()
+
+    reader.close()
+    reader._builder.join(5)
+
+    assert stopped == [True]
+    assert reader.reader.closed
+
+
+def test_cached_index(tmp_path):
+    index = SeekIndex(np.arange(0, 50, 5), np.array([0, 5]), np.full(10, -1))
+    path = SeekIndex.get_path("abc", tmp_path)
+    path.parent.mkdir(parents=True)
+    index.save(path)
+
+    cached = SeekIndex.load_cached("abc", tmp_path)
+
+    assert cached.n_frames == 10
+    assert cached.keyframe_of(7) == 5
+    assert SeekIndex.load_cached("unknown", tmp_path) is None